@@ -0,0 +1,254 @@
+# agent_process.py
+import sys
+import time
+import queue
+import types
+import inspect
+import importlib
+import threading
+import multiprocessing
+
+from tracing import log, count
+
+""" Hosts an agent in a pool of worker processes, so that CPU-heavy agents (pandas parsing, local RAG
+generation, long scoring runs) do not compete with the request threads for the GIL. Calls go over a
+pipe with a deadline; a worker that crashes or misses its deadline is killed and restarted. """
+
+START_TIMEOUT = 300  # seconds for a worker to import and initialize its agent
+CALL_TIMEOUT = 60  # seconds per call
+RESTART_BACKOFF_MAX = 60  # seconds between failed restart attempts
+
+_start_lock = threading.Lock()
+
+class AgentWorkerError(RuntimeError):
+    """
+    Raised when an agent worker fails to start, crashes or the agent method raises.
+    """
+
+def _serve(conn, module_name, class_name, background):
+    """
+    Worker process main loop: instantiates the agent and answers (method, args, kwargs) requests
+    with ("item", value) messages for generator methods followed by ("ok", result) or ("error", message).
+    The agent's background tasks are only started if background is True.
+    """
+    try:
+        agent_class = getattr(importlib.import_module(module_name), class_name)
+        if "background" in inspect.signature(agent_class).parameters:
+            agent = agent_class(background=background)
+        else:
+            agent = agent_class()
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+
+    methods = {
+        name: inspect.isgeneratorfunction(method)
+        for name, method in inspect.getmembers(agent, inspect.ismethod) if not name.startswith("_")
+    }
+    conn.send(("ready", methods))
+    while True:
+        try:
+            method, args, kwargs = conn.recv()
+        except (EOFError, OSError):
+            return  # The parent process is gone
+        try:
+            result = getattr(agent, method)(*args, **kwargs)
+            if methods.get(method):
+                for item in result:
+                    conn.send(("item", item))
+                result = None
+            conn.send(("ok", result))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+class _Worker:
+    def __init__(self, context, name, module_name, class_name, background=False):
+        self.background = background
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn, module_name, class_name, background),
+                                       name=f"agent-{name}", daemon=True)
+        # A spawned process re-runs the parent's __main__ script first, and backend.py sets up the
+        # whole app at module level; the worker only needs this module, so start it without one
+        with _start_lock:
+            main = sys.modules["__main__"]
+            sys.modules["__main__"] = types.ModuleType("__main__")
+            try:
+                self.process.start()
+            finally:
+                sys.modules["__main__"] = main
+        child_conn.close()
+        self.methods = None
+
+    def wait_ready(self, timeout):
+        try:
+            if not self.conn.poll(timeout):
+                raise AgentWorkerError(f"worker did not start within {timeout} s")
+            status, payload = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise AgentWorkerError(f"worker exited during startup (exit code {self.process.exitcode})") from e
+        if status != "ready":
+            raise AgentWorkerError(payload)
+        self.methods = payload
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+class ProcessAgent:
+    """
+    Proxy for an agent running in worker processes. It exposes the agent's public methods;
+    generator methods stream their items from the worker. Background tasks of the agent run in
+    at most one worker, see start_background_tasks.
+    """
+
+    def __init__(self, name, module_name, class_name, workers=1, timeout=CALL_TIMEOUT, start_timeout=START_TIMEOUT):
+        """
+        Starts the worker processes and waits until they have initialized the agent.
+
+        Parameters:
+            name (str): Agent name, used in errors and logs.
+            module_name (str): Module of the agent class, e.g. "agents.menu_agent".
+            class_name (str): Name of the agent class.
+            workers (int): Number of worker processes, i.e. concurrent calls.
+            timeout (float): Deadline of a call in seconds. The worker is restarted if it is missed.
+            start_timeout (float): Deadline for a worker to initialize the agent.
+        """
+        self.name = name
+        self.module_name = module_name
+        self.class_name = class_name
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.context = multiprocessing.get_context("spawn")  # No inherited threads or locks
+        self.idle = queue.Queue()
+        self.restarts = 0
+        self.closed = False
+
+        started = [_Worker(self.context, name, module_name, class_name) for _ in range(workers)]
+        try:
+            for worker in started:
+                worker.wait_ready(start_timeout)
+        except AgentWorkerError:
+            for worker in started:
+                worker.kill()
+            raise
+        for worker in started:
+            self.idle.put(worker)
+
+        self.methods = started[0].methods
+        for method_name, is_generator in self.methods.items():
+            if hasattr(ProcessAgent, method_name):
+                continue  # Handled by the proxy itself
+            setattr(self, method_name, types.MethodType(self._make_method(method_name, is_generator), self))
+
+    @staticmethod
+    def _make_method(method_name, is_generator):
+        if is_generator:
+            def stream(self, *args, **kwargs):
+                return (yield from self._request(method_name, args, kwargs))
+            method = stream
+        else:
+            def call(self, *args, **kwargs):
+                requests = self._request(method_name, args, kwargs)
+                while True:
+                    try:
+                        next(requests)
+                    except StopIteration as stop:
+                        return stop.value
+            method = call
+        method.__name__ = method_name
+        return method
+
+    def _request(self, method, args, kwargs):
+        """
+        Sends a call to an idle worker, yields the streamed items and returns the result.
+        """
+        deadline = time.monotonic() + self.timeout
+        worker = self._checkout(deadline)
+        if method == "start_background_tasks":
+            # Marked before the call, so that a replacement of this worker starts them again
+            worker.background = True
+        reusable = False
+        try:
+            worker.conn.send((method, args, kwargs))
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    count("sihteeri_agent_worker_timeouts_total", agent=self.name)
+                    raise TimeoutError(f"{self.name}.{method} did not finish within {self.timeout} s")
+                status, payload = worker.conn.recv()
+                if status == "item":
+                    yield payload
+                    continue
+                reusable = True
+                if status == "error":
+                    raise AgentWorkerError(payload)
+                return payload
+        except TimeoutError:
+            raise
+        except (EOFError, OSError) as e:  # The worker died mid-call
+            raise AgentWorkerError(f"{self.name} worker crashed during {method}") from e
+        finally:
+            # A worker that timed out, crashed or was left mid-stream is replaced
+            if reusable:
+                self.idle.put(worker)
+            else:
+                self._replace(worker)
+
+    def _checkout(self, deadline):
+        while True:
+            try:
+                worker = self.idle.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError(f"No {self.name} worker became available within {self.timeout} s")
+            if worker.process.is_alive():
+                return worker
+            self._replace(worker)  # Crashed while idle
+
+    def _replace(self, worker):
+        """
+        Kills a worker and starts a replacement in the background, retrying with backoff.
+        """
+        worker.kill()
+        if self.closed:
+            return
+        self.restarts += 1
+        count("sihteeri_agent_worker_restarts_total", agent=self.name)
+        log("agent_worker_restart", agent=self.name, exit_code=worker.process.exitcode, restarts=self.restarts)
+
+        def run():
+            backoff = 1
+            while not self.closed:
+                replacement = _Worker(self.context, self.name, self.module_name, self.class_name, worker.background)
+                try:
+                    replacement.wait_ready(self.start_timeout)
+                except AgentWorkerError as e:
+                    replacement.kill()
+                    log("agent_worker_start_failed", agent=self.name, error=str(e))
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+                    continue
+                self.idle.put(replacement)
+                return
+
+        threading.Thread(target=run, name=f"restart-{self.name}", daemon=True).start()
+
+    def start_background_tasks(self):
+        """
+        Starts the agent's background tasks in one of the workers; the others only serve calls.
+        """
+        if "start_background_tasks" in self.methods:
+            for _ in self._request("start_background_tasks", (), {}):
+                pass
+
+    def shutdown(self):
+        """
+        Stops the idle workers. Workers busy with a call are stopped when the call ends.
+        """
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().kill()
+            except queue.Empty:
+                return
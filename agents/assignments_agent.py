@@ -1,17 +1,55 @@
 import sys
 import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from storage import Storage
+from file_sync import DirectoryWatcher, watch
 from chatgpt import interpret_prompt
 
+# Evaluation instructions for scoring answers in Finnish, and the model used
+SCORING_SYSTEM_PROMPT = (
+    "Olet opetusavustaja, jonka tehtävänä on arvioida opiskelijoiden tehtäviä. "
+    "Tehtäväsi on lukea tehtävän ohjeet ja opiskelijan vastaus, ja antaa sen jälkeen arvosana ja palautetta. "
+    "Anna rakentavaa palautetta mainiten vahvuudet ja kehityskohteet."
+)
+SCORING_MODEL = "gpt-3.5-turbo"
+
+# Root of the course data; SIHTEERI_DATA_DIR overrides it, e.g. for benchmarks
+DATA_DIR = os.environ.get("SIHTEERI_DATA_DIR", "C:/workspace/mwtuni/data")
+
+# Query results are cached until the assignments table changes in any process; it only changes on sync
+QUERY_CACHE_BYTES = 4 * 1024 * 1024
+
 class AssignmentsAgent:
     description = "Tracks assignment deadlines, statuses, and provides reminders."
 
-    def __init__(self):
-        self.storage = Storage()
+    def __init__(self, assignments_folder=f"{DATA_DIR}/assignments",
+                 answers_folder=f"{DATA_DIR}/answers", storage=None, poll_interval=5.0, background=True):
+        self.assignments_folder = assignments_folder
+        self.answers_folder = answers_folder
+        self.poll_interval = poll_interval
+        self.storage = storage or Storage(query_cache_bytes=QUERY_CACHE_BYTES)
         self._initialize_table()
-        self._populate_assignments_from_files()
+
+        # Incremental sync: only files changed since the last scan (also over restarts) are processed
+        self.assignments_watcher = DirectoryWatcher(assignments_folder, self.storage)
+        self.answers_watcher = DirectoryWatcher(answers_folder, self.storage)
+        self.answers = self.answers_watcher.names()
+        self.sync_lock = threading.Lock()
+        self.sync()
+        if background:
+            self.start_background_tasks()
+
+    def start_background_tasks(self):
+        """
+        Starts watching the assignments and answers folders.
+        """
+        if self.poll_interval:
+            watch([self.assignments_folder, self.answers_folder], self.sync, interval=self.poll_interval)
 
     def _initialize_table(self):
         schema = {
@@ -22,18 +60,62 @@ class AssignmentsAgent:
                 "due_date": "TEXT NOT NULL",
                 "status": "TEXT NOT NULL DEFAULT 'pending'"
             },
-            "constraints": ["UNIQUE(title, due_date)"]
+            "constraints": ["UNIQUE(title, due_date)"],
+            # get_upcoming_assignments and get_due_soon search pending assignments by due date
+            "indexes": [{"columns": ["status", "due_date"], "where": "status = 'pending'"}]
         }
         self.storage.create_table(schema)
 
-    def _populate_assignments_from_files(self):
-        assignments_folder = "C:/workspace/mwtuni/data/assignments"
-        answers_folder = "C:/workspace/mwtuni/data/answers"
+        # Cached scores keyed by the hash of everything that affects the score
+        self.storage.create_table({
+            "table": "scores",
+            "fields": {
+                "key": "TEXT PRIMARY KEY",
+                "task_name": "TEXT NOT NULL",
+                "score": "TEXT NOT NULL",
+                "created_at": "REAL NOT NULL"
+            }
+        })
+
+    def sync(self, force=False):
+        """
+        Brings the assignments table up to date with the assignments and answers folders.
+        Cheap when nothing has changed, so it is called before every query.
+        """
+        with self.sync_lock:
+            if not force and not self.assignments_watcher.is_stale() and not self.answers_watcher.is_stale():
+                return
+            try:
+                # The file state is recorded in the same transaction as the ingestion
+                with self.storage.transaction():
+                    added, _, _ = self.assignments_watcher.scan(force)
+                    answers_added, _, answers_removed = self.answers_watcher.scan(force)
+                    self.answers = self.answers_watcher.names()
 
-        # Get lists of assignments and answers
-        assignments_files = os.listdir(assignments_folder)
-        answers_files = os.listdir(answers_folder)
+                    # New assignments, plus assignments whose answer appeared or disappeared
+                    changed_titles = set(answers_added) | set(answers_removed)
+                    filenames = set(added)
+                    if changed_titles:
+                        filenames.update(f for f in self.assignments_watcher.names() if f.rsplit('_', 1)[0] in changed_titles)
+                    if filenames:
+                        self._populate_assignments_from_files(filenames)
+            except Exception:
+                # Rolled back: forget the scanned state too, so the next scan sees the changes again
+                self.assignments_watcher.load_state()
+                self.answers_watcher.load_state()
+                self.answers = self.answers_watcher.names()
+                raise
+
+    def _populate_assignments_from_files(self, assignments_files):
+        answers_files = self.answers
+
+        # Current statuses of all known assignments, fetched in one query
+        existing = {
+            (title, due_date): status
+            for title, due_date, status in self.storage.execute_query("SELECT title, due_date, status FROM assignments")
+        }
 
+        rows = []
         for filename in assignments_files:
             if '_' in filename:
                 title, due_date_str = filename.rsplit('_', 1)
@@ -48,23 +130,14 @@ class AssignmentsAgent:
                 # Determine current status based on presence in answers
                 new_status = "submitted" if title in answers_files else "pending"
 
-                # Check if assignment is already in the database
-                existing_assignment = self.storage.execute_query(
-                    "SELECT id, status FROM assignments WHERE title = ? AND due_date = ?", 
-                    (title, due_date)
-                )
-                
-                if existing_assignment:
-                    # If the assignment exists and the status has changed, update it
-                    assignment_id, current_status = existing_assignment[0]
-                    if current_status != new_status:
-                        self.storage.update_data("assignments", {"status": new_status}, "id = ?", (assignment_id,))
-                        print(f"Updated assignment '{title}' status to '{new_status}' based on answer file presence.")
-                else:
-                    # Insert new assignment if it does not exist
-                    data = {"title": title, "due_date": due_date, "status": new_status}
-                    result = self.storage.insert_data("assignments", data, unique_columns=["title", "due_date"])
-                    print(f"Inserted: {data if isinstance(result, int) else result}")
+                # Only new assignments and changed statuses need to be written
+                if existing.get((title, due_date)) != new_status:
+                    rows.append({"title": title, "due_date": due_date, "status": new_status})
+
+        # Reconcile the whole directory in one batch
+        self.storage.upsert_many("assignments", rows, conflict_columns=["title", "due_date"], update_columns=["status"])
+        inserted = sum(1 for row in rows if (row["title"], row["due_date"]) not in existing)
+        print(f"Assignments synced: {inserted} inserted, {len(rows) - inserted} status updates.")
 
     def add_assignment(self, title, due_date):
         try:
@@ -76,6 +149,7 @@ class AssignmentsAgent:
             return "Error: Invalid date format. Please use 'YYYY-MM-DD'."
 
     def get_upcoming_assignments(self, days_ahead=7):
+        self.sync()
         now = datetime.now()
         upcoming_date = now + timedelta(days=days_ahead)
         rows = self.storage.fetch_rows_by_date_range("assignments", "due_date", now, upcoming_date, status="pending")
@@ -93,6 +167,7 @@ class AssignmentsAgent:
         return f"Assignment with ID {assignment_id} marked as completed." if success else f"Assignment with ID {assignment_id} not found."
 
     def get_due_soon(self, days_ahead=2):
+        self.sync()
         now = datetime.now()
         due_soon_date = now + timedelta(days=days_ahead)
         rows = self.storage.fetch_rows_by_date_range("assignments", "due_date", now, due_soon_date, status="pending")
@@ -105,47 +180,52 @@ class AssignmentsAgent:
             result += f"- {row['title']} (Due: {row['due_date']})\n"
         return result
     
-    def score(self, task_name: str) -> str:
+    def _read_pair(self, task_name: str):
         """
-        Scores an assignment by comparing the assignment content with the answer content using interpret_prompt from chatgpt.py.
-
-        Parameters:
-            task_name (str): The name of the task to be scored.
+        Reads the assignment and answer files of a task.
 
         Returns:
-            str: The score and feedback generated by ChatGPT.
+            tuple: (assignment_content, answer_content), or (None, error message) if a file is missing.
         """
-        assignments_folder = "C:/workspace/mwtuni/data/assignments"
-        answers_folder = "C:/workspace/mwtuni/data/answers"
-
-        # Construct file paths for assignment and answer
-        assignment_files = [f for f in os.listdir(assignments_folder) if f.startswith(task_name)]
+        assignment_files = sorted(f for f in self.assignments_watcher.names() if f.startswith(task_name))
         if not assignment_files:
-            return f"Assignment file for '{task_name}' not found."
-        assignment_file_path = os.path.join(assignments_folder, assignment_files[0])
-        answer_file_path = os.path.join(answers_folder, task_name)
+            return None, f"Assignment file for '{task_name}' not found."
+        assignment_file_path = os.path.join(self.assignments_folder, assignment_files[0])
+        answer_file_path = os.path.join(self.answers_folder, task_name)
 
         # Check for file existence
         if not os.path.exists(assignment_file_path):
-            return f"Assignment file for '{task_name}' not found."
+            return None, f"Assignment file for '{task_name}' not found."
         if not os.path.exists(answer_file_path):
-            return f"Answer file for '{task_name}' not found."
+            return None, f"Answer file for '{task_name}' not found."
 
         # Read contents of the assignment and answer files
         with open(assignment_file_path, 'r', encoding='utf-8') as f:
             assignment_content = f.read()
         with open(answer_file_path, 'r', encoding='utf-8') as f:
             answer_content = f.read()
-        print("Assignment content:", assignment_content)
-        print("Answer content:", answer_content)
-
-        # Define the system prompt with evaluation instructions in Finnish
-        system_prompt = (
-            "Olet opetusavustaja, jonka tehtävänä on arvioida opiskelijoiden tehtäviä. "
-            "Tehtäväsi on lukea tehtävän ohjeet ja opiskelijan vastaus, ja antaa sen jälkeen arvosana ja palautetta. "
-            "Anna rakentavaa palautetta mainiten vahvuudet ja kehityskohteet."
-        )
+        return assignment_content, answer_content
 
+    @staticmethod
+    def _score_key(assignment_content: str, answer_content: str) -> str:
+        """
+        Returns the cache key of a score: everything that affects the result is hashed.
+        """
+        digest = hashlib.sha256()
+        for part in (assignment_content, answer_content, SCORING_SYSTEM_PROMPT, SCORING_MODEL):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _cached_score(self, key: str):
+        rows = self.storage.execute_query("SELECT score FROM scores WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def _request_score(self, task_name: str, key: str, assignment_content: str, answer_content: str) -> str:
+        """
+        Scores an answer with ChatGPT and caches the score. Transient failures are retried by
+        the LLM client.
+        """
         # Combine assignment and answer into a single user prompt in Finnish
         user_prompt = (
             f"Arvioi opiskelijan vastaus annetun tehtävän ohjeiden perusteella.\n\n"
@@ -153,11 +233,88 @@ class AssignmentsAgent:
             "Anna arvosana asteikolla 1–5 ja yksityiskohtainen palaute. Anna lopuksi täydellinen esimerkkivastaus tehtävään."
         )
 
-        # Call interpret_prompt from chatgpt.py and return the result
-        return interpret_prompt(user_prompt, system_prompt)    
+        score = interpret_prompt(user_prompt, SCORING_SYSTEM_PROMPT, model=SCORING_MODEL)
+
+        self.storage.upsert_many(
+            "scores", [{"key": key, "task_name": task_name, "score": score, "created_at": time.time()}],
+            conflict_columns=["key"], update_columns=["task_name", "score", "created_at"]
+        )
+        return score
+
+    def score(self, task_name: str) -> str:
+        """
+        Scores an assignment by comparing the assignment content with the answer content using interpret_prompt from chatgpt.py.
+        Scores are cached, so re-scoring an unchanged answer does not call ChatGPT again.
+
+        Parameters:
+            task_name (str): The name of the task to be scored.
+
+        Returns:
+            str: The score and feedback generated by ChatGPT.
+        """
+        self.sync()
+        assignment_content, answer_content = self._read_pair(task_name)
+        if assignment_content is None:
+            return answer_content
+        print(f"Scoring '{task_name}': assignment {len(assignment_content)} chars, answer {len(answer_content)} chars")
+
+        key = self._score_key(assignment_content, answer_content)
+        cached = self._cached_score(key)
+        if cached is not None:
+            return cached
+        return self._request_score(task_name, key, assignment_content, answer_content)
+
+    def score_all(self, max_workers: int = 4) -> str:
+        """
+        Scores every submitted answer in the answers folder concurrently. Answers whose
+        assignment and content are unchanged since they were last scored are skipped.
+        A long batch job, run from the command line: python agents/assignments_agent.py score_all
+
+        Parameters:
+            max_workers (int): Maximum number of concurrent ChatGPT calls.
+
+        Returns:
+            str: A summary with the number of scored, skipped and failed answers and the throughput.
+        """
+        self.sync()
+        started = time.perf_counter()
+        titles = {filename.rsplit('_', 1)[0] for filename in self.assignments_watcher.names() if '_' in filename}
+
+        pending = []
+        skipped = 0
+        for task_name in sorted(self.answers & titles):
+            assignment_content, answer_content = self._read_pair(task_name)
+            if assignment_content is None:
+                continue
+            key = self._score_key(assignment_content, answer_content)
+            if self._cached_score(key) is not None:
+                skipped += 1
+            else:
+                pending.append((task_name, key, assignment_content, answer_content))
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="score") as executor:
+            futures = {executor.submit(self._request_score, *item): item[0] for item in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Scoring '{futures[future]}' failed: {e}")
+                    failed.append(futures[future])
+
+        elapsed = time.perf_counter() - started
+        scored = len(pending) - len(failed)
+        result = (f"Scored {scored} answers in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.2f} answers/s), "
+                  f"{skipped} unchanged skipped, {len(failed)} failed.")
+        if failed:
+            result += "\nFailed: " + ", ".join(sorted(failed))
+        return result
 
-# Example usage
+# Example usage; "score_all" scores every submitted answer
 if __name__ == "__main__":
-    agent = AssignmentsAgent()
-    print(agent.get_upcoming_assignments(7))
-    print(agent.get_due_soon(2))
+    agent = AssignmentsAgent(background=False)
+    if sys.argv[1:] == ["score_all"]:
+        print(agent.score_all())
+    else:
+        print(agent.get_upcoming_assignments(7))
+        print(agent.get_due_soon(2))
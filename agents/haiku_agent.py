@@ -1,29 +1,144 @@
 # agents/haiku_agent.py
+import sys
 import os
-from openai import OpenAI
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import chat_completion_choices, get_client
+from storage import Storage
 
 class HaikuAgent:
     description = "Writes inspiring haiku poems."
 
-    def __init__(self):
-        # Ensure the API key is set
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if api_key is None:
-            raise ValueError("API key not found. Please set the OPENAI_API_KEY environment variable.")
+    def __init__(self, storage=None, pool_size=20, low_water=5, batch_size=5, refill_interval=30, background=True):
+        """
+        Initializes the HaikuAgent.
 
-        # Initialize the OpenAI client
-        self.client = OpenAI(api_key=api_key)
+        Any good haiku will do, so haikus are pre-generated into a bounded pool persisted in
+        SQLite and served from there. When the pool drops below low_water, a background task
+        refills it up to pool_size, batch_size haikus per completion call. The pool is shared by
+        all processes, but only the one running the background tasks refills it: it checks the
+        pool every refill_interval seconds and after each haiku it serves.
+        """
+        # Ensure the API key is set; the pooled client is shared with the prompt interpreter
+        self.client = get_client()
+        self.storage = storage or Storage()
+        self.pool_size = pool_size
+        self.low_water = low_water
+        self.batch_size = batch_size
+        self.refill_interval = refill_interval
+        self.refill_lock = threading.Lock()
+        self.refilling = False
+        self.refills = False
+        self._initialize_table()
+        if background:
+            self.start_background_tasks()
 
-    # Define function to write a haiku
-    def haiku(self):
-        chat_completion = self.client.chat.completions.create(
+    def start_background_tasks(self):
+        """
+        Tops the pool up in the background and keeps it topped up.
+        """
+        self.refills = True
+        self._refill_in_background()
+        if self.refill_interval:
+            threading.Thread(target=self._schedule, name="haiku-schedule", daemon=True).start()
+
+    def _schedule(self):
+        while True:
+            time.sleep(self.refill_interval)
+            try:
+                if self._pool_count() < self.low_water:
+                    self._refill_in_background()
+            except Exception as e:
+                print(f"Haiku pool check failed: {e}")
+
+    def _initialize_table(self):
+        schema = {
+            "table": "haiku_pool",
+            "fields": {
+                "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+                "haiku": "TEXT NOT NULL",
+                "created_at": "REAL NOT NULL"
+            }
+        }
+        self.storage.create_table(schema)
+
+    def _pool_count(self):
+        return self.storage.execute_query("SELECT COUNT(*) FROM haiku_pool")[0][0]
+
+    def _generate(self, count):
+        """
+        Generates count haikus with a single completion call.
+        """
+        return chat_completion_choices(
             messages=[
                 {"role": "system", "content": "Write a properly formatted haiku."},
                 {"role": "user", "content": "Do it in English!"},
             ],
             model="gpt-3.5-turbo",
+            n=count,
         )
-        chatgpt_reply = chat_completion.choices[0].message.content
+
+    def _store(self, haikus):
+        now = time.time()
+        with self.storage.transaction() as conn:
+            # Never grow the pool past pool_size, even if haikus were generated concurrently
+            room = self.pool_size - conn.execute("SELECT COUNT(*) FROM haiku_pool").fetchone()[0]
+            conn.executemany("INSERT INTO haiku_pool (haiku, created_at) VALUES (?, ?)",
+                             [(haiku, now) for haiku in haikus[:max(room, 0)]])
+
+    def _refill(self):
+        """
+        Tops the pool up to pool_size in batches.
+        """
+        missing = self.pool_size - self._pool_count()
+        while missing > 0:
+            haikus = [haiku for haiku in self._generate(min(self.batch_size, missing)) if haiku]
+            if not haikus:
+                break
+            self._store(haikus)
+            missing -= len(haikus)
+
+    def _refill_in_background(self):
+        """
+        Starts a refill unless one is already running.
+        """
+        with self.refill_lock:
+            if self.refilling:
+                return
+            self.refilling = True
+
+        def run():
+            try:
+                self._refill()
+            except Exception as e:
+                print(f"Haiku pool refill failed: {e}")
+            finally:
+                self.refilling = False
+
+        threading.Thread(target=run, name="haiku-refill", daemon=True).start()
+
+    def _take(self):
+        """
+        Removes the oldest haiku from the pool and returns it, or None if the pool is empty.
+        """
+        with self.storage.transaction() as conn:
+            row = conn.execute("SELECT id, haiku FROM haiku_pool ORDER BY id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM haiku_pool WHERE id = ?", (row[0],))
+        return row[1]
+
+    # Define function to write a haiku
+    def haiku(self):
+        chatgpt_reply = self._take()
+        if chatgpt_reply is None:
+            # Pool exhausted: generate one batch now and keep the rest
+            chatgpt_reply, *rest = self._generate(self.batch_size)
+            self._store(rest)
+        if self.refills and self._pool_count() < self.low_water:
+            self._refill_in_background()
         return chatgpt_reply
 
 if __name__ == "__main__":
@@ -1,30 +1,222 @@
 # agents/menu_agent.py
 import sys
 import os
+import time
+import threading
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from ollama_rag import OllamaRAG
+from storage import Storage
+
+# Location of the menu document; SIHTEERI_MENU_URL overrides it, e.g. for benchmarks
+MENU_URL = os.environ.get("SIHTEERI_MENU_URL", "http://127.0.0.1:8088/menub.txt")
 
 class MenuAgent:
     description = "Finds out today's lunch menu."
 
-    def __init__(self):
+    def __init__(self, urls=(MENU_URL,), storage=None, refresh_interval=600, background=True):
         """
         Initializes the MenuAgent for retrieving today's lunch menu.
+
+        The answer only changes once a day or when the menu changes, so it is materialized per
+        date and source document hash, persisted in SQLite and served from memory. A scheduler
+        rechecks the menu every refresh_interval seconds and regenerates the answer when needed;
+        with background=False it is started later by start_background_tasks(). Processes without
+        the scheduler serve the newest answer stored by the one running it, rereading it every
+        refresh_interval seconds.
         """
+        self.urls = list(urls)
+        self.refresh_interval = refresh_interval
         self.rag = OllamaRAG()
-        self.rag.setup_vectorstore(["http://127.0.0.1:8088/menub.txt"])
+        self.rag.setup_vectorstore(self.urls)
+        self.storage = storage or Storage()
+        self._initialize_table()
+
+        self.answer = None  # (date, source hash, answer) of the latest materialized answer
+        self.loaded_at = 0.0
+        self.scheduled = False
+        self.generate_lock = threading.Lock()
+        self.revalidating = False
+        if background:
+            self.start_background_tasks()
+
+    def start_background_tasks(self):
+        """
+        Starts the scheduler that refreshes the menu and the materialized answer.
+        """
+        if self.refresh_interval:
+            self.scheduled = True
+            threading.Thread(target=self._schedule, args=(self.refresh_interval,), name="menu-refresh", daemon=True).start()
+
+    def _initialize_table(self):
+        schema = {
+            "table": "menu_answers",
+            "fields": {
+                "date": "TEXT NOT NULL",
+                "source_hash": "TEXT NOT NULL",
+                "answer": "TEXT NOT NULL",
+                "created_at": "REAL NOT NULL"
+            },
+            "constraints": ["PRIMARY KEY(date, source_hash)"]
+        }
+        self.storage.create_table(schema)
+
+    @staticmethod
+    def _today():
+        return datetime.now().strftime("%d.%m.%Y")
+
+    @staticmethod
+    def _prompt(date):
+        return f"What is for lunch on {date}?"
+
+    def _schedule(self, refresh_interval):
+        while True:
+            try:
+                self._materialize(self._today())
+            except Exception as e:
+                print(f"Menu refresh failed: {e}")
+            time.sleep(refresh_interval)
+            try:
+                # Refetch the menu; only changed chunks are embedded again
+                self.rag.setup_vectorstore(self.urls)
+            except Exception as e:
+                print(f"Menu refresh failed: {e}")
+
+    def _materialize(self, date):
+        """
+        Returns the answer for the date and the current menu, generating and storing it if needed.
+        """
+        source_hash = self.rag.corpus_hash
+        answer = self.answer
+        if answer and answer[:2] == (date, source_hash):
+            return answer[2]
+
+        with self.generate_lock:
+            # Another thread may have generated the answer while we waited
+            answer = self.answer
+            if answer and answer[:2] == (date, source_hash):
+                return answer[2]
+
+            stored = self._load_stored(date, source_hash)
+            if stored:
+                self.answer = stored
+                return stored[2]
+            text = self.rag.query(self._prompt(date))
+            self._store(date, source_hash, text)
+            self.answer = (date, source_hash, text)
+            return text
+
+    def _load_stored(self, date, source_hash):
+        """
+        Returns the stored (date, source hash, answer) for the date and the menu. Without the
+        scheduler the menu of this process may be outdated, so the newest answer for the date
+        is returned instead.
+        """
+        self.loaded_at = time.monotonic()
+        if self.scheduled:
+            rows = self.storage.execute_query(
+                "SELECT source_hash, answer FROM menu_answers WHERE date = ? AND source_hash = ?", (date, source_hash)
+            )
+        else:
+            rows = self.storage.execute_query(
+                "SELECT source_hash, answer FROM menu_answers WHERE date = ? ORDER BY created_at DESC LIMIT 1", (date,)
+            )
+        return (date, rows[0][0], rows[0][1]) if rows else None
+
+    def _current(self, today):
+        """
+        Returns the materialized answer if it is for today. If the menu has changed since it was
+        generated, a new one is generated in the background; without the scheduler the newest
+        stored answer is reread instead.
+        """
+        answer = self.answer
+        if not answer or answer[0] != today:
+            return None
+        if self.scheduled:
+            if answer[1] != self.rag.corpus_hash:
+                self._revalidate(today)
+        elif self.refresh_interval and time.monotonic() - self.loaded_at >= self.refresh_interval:
+            answer = self.answer = self._load_stored(today, self.rag.corpus_hash) or answer
+        return answer
+
+    def _store(self, date, source_hash, text):
+        self.storage.upsert_many(
+            "menu_answers",
+            [{"date": date, "source_hash": source_hash, "answer": text, "created_at": time.time()}],
+            conflict_columns=["date", "source_hash"], update_columns=["answer", "created_at"]
+        )
+        week_ago = time.time() - timedelta(days=7).total_seconds()
+        self.storage.execute_query("DELETE FROM menu_answers WHERE created_at < ?", (week_ago,))
+
+    def _revalidate(self, date):
+        """
+        Regenerates the answer in the background, unless a regeneration is already running.
+        """
+        if self.revalidating:
+            return
+        self.revalidating = True
+
+        def run():
+            try:
+                self._materialize(date)
+            except Exception as e:
+                print(f"Menu refresh failed: {e}")
+            finally:
+                self.revalidating = False
+
+        threading.Thread(target=run, name="menu-revalidate", daemon=True).start()
 
     def get_today_menu(self):
         """
-        Retrieves today's lunch menu by querying the LLM + RAG.
+        Retrieves today's lunch menu by querying the LLM + RAG, or from the materialized answer.
+        If the menu has changed since the answer was generated, the previous answer is served
+        while a new one is generated in the background.
+        """
+        today = self._today()
+        answer = self._current(today)
+        if answer:
+            return answer[2]
+        return self._materialize(today)
+
+    def stream_today_menu(self):
+        """
+        Streams today's lunch menu token by token as the local LLM generates it. A materialized
+        answer is returned whole. Only one request generates at a time; concurrent ones wait
+        for its answer instead of starting their own generation.
         """
-        today = datetime.now().strftime("%d.%m.%Y")
-        prompt = f"What is for lunch on {today}?"
-        return self.rag.query(prompt)
+        today = self._today()
+        answer = self._current(today)
+        if answer:
+            yield answer[2]
+            return
+
+        if not self.generate_lock.acquire(blocking=False):
+            yield self._materialize(today)
+            return
+        try:
+            source_hash = self.rag.corpus_hash
+            # Generated while we were checking, or stored by another process
+            answer = self.answer
+            if not (answer and answer[:2] == (today, source_hash)):
+                answer = self._load_stored(today, source_hash)
+            if answer:
+                self.answer = answer
+                yield answer[2]
+                return
+
+            tokens = []
+            for token in self.rag.query_stream(self._prompt(today)):
+                tokens.append(token)
+                yield token
+
+            text = "".join(tokens)
+            self._store(today, source_hash, text)
+            self.answer = (today, source_hash, text)
+        finally:
+            self.generate_lock.release()
 
 # Example usage
 if __name__ == "__main__":
-    agent = MenuAgent()
+    agent = MenuAgent(refresh_interval=None)
     print(agent.get_today_menu())
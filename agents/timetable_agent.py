@@ -1,66 +1,334 @@
-import pandas as pd
-from datetime import datetime
+import sys
+import os
+import re
+import bisect
+import heapq
+import time
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import Storage
+from file_sync import watch
+
+# One class in the timetable; start combines the date (Pvm) with the start of the time range (Aika)
+Lesson = namedtuple("Lesson", ["start", "time", "course", "room", "team", "teacher"])
+
+# Lessons sorted by start time, with per-course and per-room (starts, lessons) indexes and the
+# (starts, lessons) of the other filters queried so far. The whole index is swapped in one
+# assignment when the timetable is reloaded, which also drops those selections.
+TimetableIndex = namedtuple("TimetableIndex", ["lessons", "starts", "by_course", "by_room", "selections"])
+
+# Filters (substring matches, course and room together) whose selections are kept per timetable
+MAX_SELECTIONS = 256
+
+# Root of the course data; SIHTEERI_DATA_DIR overrides it, e.g. for benchmarks
+DATA_DIR = os.environ.get("SIHTEERI_DATA_DIR", "c:/workspace/mwtuni/data")
 
 class TimetableAgent:
     description = "Handles timetable queries."
 
-    def __init__(self, csv_path="c:/workspace/mwtuni/data/lukkari.csv"):
+    def __init__(self, csv_path=f"{DATA_DIR}/lukkari.csv", storage=None, poll_interval=10.0, background=True):
         """
-        Initializes the TimetableAgent by loading and preparing timetable data from a CSV file.
+        Initializes the TimetableAgent by loading the timetable and parsing it once into a
+        list of lessons sorted by start time. The parsed lessons are snapshotted in SQLite,
+        so a restart with an unchanged CSV skips CSV parsing and the pandas import. The CSV is
+        watched for changes and reparsed in the background, unless background is False; then
+        start_background_tasks() starts the watcher later, and until then the CSV is rechecked
+        on queries at most every poll_interval seconds.
         """
-        try:
-            # Load the CSV file with the specified encoding and delimiter
-            self.df = pd.read_csv(csv_path, delimiter=";", encoding="utf-8")
-            self.df.columns = [col.strip() for col in self.df.columns]  # Clean up column names
+        self.csv_path = csv_path
+        self.poll_interval = poll_interval
+        self.storage = storage or Storage()
+        self.index = None
+        self.error = None
+        self.file_state = None
+        self.checked_at = 0.0
+        self.watching = False
+        self.reload_lock = threading.Lock()
+        self._initialize_tables()
+        self.reload()
+        if background:
+            self.start_background_tasks()
 
-            # Rename columns if necessary to standardize access
-            expected_columns = {
-                "Viikko": "Week", "Päivä": "Day", "Pvm": "Pvm", 
-                "Aika": "Aika", "Kurssi": "Kurssi", "Tila": "Tila", 
-                "Tiimi": "Team", "Opettaja": "Teacher"
+    def start_background_tasks(self):
+        """
+        Starts watching the CSV for changes.
+        """
+        if self.poll_interval:
+            self.watching = True
+            watch([os.path.dirname(os.path.abspath(self.csv_path))], lambda force: self.reload(), interval=self.poll_interval)
+
+    def _initialize_tables(self):
+        self.storage.create_table({
+            "table": "timetable_snapshot",
+            "fields": {
+                "path": "TEXT PRIMARY KEY",
+                "size": "INTEGER NOT NULL",
+                "mtime": "INTEGER NOT NULL"
+            }
+        })
+        self.storage.create_table({
+            "table": "timetable_lessons",
+            "fields": {
+                "path": "TEXT NOT NULL",
+                "start": "TEXT NOT NULL",
+                "time": "TEXT NOT NULL",
+                "course": "TEXT NOT NULL",
+                "room": "TEXT NOT NULL",
+                "team": "TEXT",
+                "teacher": "TEXT"
             }
-            self.df.rename(columns=expected_columns, inplace=True)
+        })
 
-        except Exception as e:
-            print(f"Error loading timetable CSV: {e}")
-            self.df = None
+    def reload(self):
+        """
+        Reloads the timetable if the CSV has changed (size or mtime) since it was last loaded.
+        The new index replaces the old one atomically, so queries never see a partial timetable.
+        """
+        with self.reload_lock:
+            self.checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.csv_path)
+            except OSError as e:
+                if self.index is None:
+                    print(f"Error loading timetable CSV: {e}")
+                return
+            file_state = (stat.st_size, stat.st_mtime_ns)
+            if file_state == self.file_state:
+                return
 
-    def get_next_class(self):
+            try:
+                lessons = self._load_snapshot(file_state)
+                if lessons is None:
+                    lessons = self._parse_csv()
+                    self._save_snapshot(file_state, lessons)
+                self.index = self._build_index(lessons)
+                self.error = None
+            except KeyError:
+                # Keep serving the previous timetable if there is one
+                if self.index is None:
+                    self.error = "The timetable data is missing required columns."
+                print("Error loading timetable CSV: required columns missing")
+            except Exception as e:
+                print(f"Error loading timetable CSV: {e}")
+            self.file_state = file_state
+
+    def _load_snapshot(self, file_state):
         """
-        Returns information about the next upcoming class including date, time, course, and location.
+        Returns the snapshotted lessons if they were parsed from the CSV in its current state.
+        """
+        rows = self.storage.execute_query("SELECT size, mtime FROM timetable_snapshot WHERE path = ?", (self.csv_path,))
+        if not rows or tuple(rows[0]) != file_state:
+            return None
+        rows = self.storage.execute_query(
+            "SELECT start, time, course, room, team, teacher FROM timetable_lessons WHERE path = ?", (self.csv_path,)
+        )
+        return [Lesson(datetime.fromisoformat(row[0]), *row[1:]) for row in rows]
+
+    def _save_snapshot(self, file_state, lessons):
+        with self.storage.transaction() as conn:
+            conn.execute("DELETE FROM timetable_lessons WHERE path = ?", (self.csv_path,))
+            conn.executemany(
+                "INSERT INTO timetable_lessons (path, start, time, course, room, team, teacher) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(self.csv_path, lesson.start.isoformat(), *lesson[1:]) for lesson in lessons]
+            )
+            self.storage.upsert_many(
+                "timetable_snapshot", [{"path": self.csv_path, "size": file_state[0], "mtime": file_state[1]}],
+                conflict_columns=["path"], update_columns=["size", "mtime"]
+            )
+
+    def _parse_csv(self):
+        """
+        Parses the timetable CSV into lessons. pandas is only imported when the CSV has to be parsed.
+        """
+        import pandas as pd
+
+        # Load the CSV file with the specified encoding and delimiter
+        df = pd.read_csv(self.csv_path, delimiter=";", encoding="utf-8")
+        df.columns = [col.strip() for col in df.columns]  # Clean up column names
+
+        # Rename columns if necessary to standardize access
+        expected_columns = {
+            "Viikko": "Week", "Päivä": "Day", "Pvm": "Pvm",
+            "Aika": "Aika", "Kurssi": "Kurssi", "Tila": "Tila",
+            "Tiimi": "Team", "Opettaja": "Teacher"
+        }
+        df.rename(columns=expected_columns, inplace=True)
+        return self._parse_lessons(df)
+
+    @staticmethod
+    def _parse_start_time(time_range):
+        """
+        Returns the (hour, minute) a time range such as "8.15-10.00" starts at.
+        """
+        match = re.match(r"\s*(\d{1,2})[.:](\d{2})", str(time_range))
+        return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+
+    def _parse_lessons(self, df):
+        """
+        Converts the timetable data frame into lessons, dropping rows without the essential columns.
+        """
+        necessary_columns = ["Pvm", "Aika", "Kurssi", "Tila"]
+        missing = [col for col in necessary_columns if col not in df.columns]
+        if missing:
+            raise KeyError(", ".join(missing))
+
+        import pandas as pd
+
+        df = df.dropna(subset=necessary_columns)
+        dates = pd.to_datetime(df["Pvm"], errors="coerce", dayfirst=True)
+        teams = df["Team"] if "Team" in df.columns else [None] * len(df)
+        teachers = df["Teacher"] if "Teacher" in df.columns else [None] * len(df)
+
+        lessons = []
+        for date, time_range, course, room, team, teacher in zip(dates, df["Aika"], df["Kurssi"], df["Tila"], teams, teachers):
+            if pd.isna(date):
+                continue
+            hour, minute = self._parse_start_time(time_range)
+            start = datetime(date.year, date.month, date.day, hour, minute)
+            lessons.append(Lesson(start, str(time_range).strip(), str(course).strip(), str(room).strip(),
+                                  None if pd.isna(team) else str(team), None if pd.isna(teacher) else str(teacher)))
+        return lessons
+
+    @staticmethod
+    def _build_index(lessons):
+        """
+        Sorts the lessons by start time and builds the per-course and per-room indexes.
+        """
+        lessons = sorted(lessons, key=lambda lesson: lesson.start)
+        by_course = {}
+        by_room = {}
+        for lesson in lessons:
+            by_course.setdefault(lesson.course.lower(), []).append(lesson)
+            by_room.setdefault(lesson.room.lower(), []).append(lesson)
+
+        return TimetableIndex(
+            lessons,
+            [lesson.start for lesson in lessons],
+            {key: ([lesson.start for lesson in group], group) for key, group in by_course.items()},
+            {key: ([lesson.start for lesson in group], group) for key, group in by_room.items()},
+            {}
+        )
+
+    def _select(self, course=None, room=None):
+        """
+        Returns the sorted start times and lessons matching the optional course and room filters.
+        Filters match case-insensitively, first exactly and then as a substring.
+        """
+        timetable = self.index
+        if course is None and room is None:
+            return timetable.starts, timetable.lessons
+
+        key = (course and course.lower(), room and room.lower())
+        if room is None and key[0] in timetable.by_course:
+            return timetable.by_course[key[0]]
+        if course is None and key[1] in timetable.by_room:
+            return timetable.by_room[key[1]]
+
+        selection = timetable.selections.get(key)
+        if selection is None:
+            selection = self._filter(timetable, *key)
+            if len(timetable.selections) >= MAX_SELECTIONS:
+                timetable.selections.clear()
+            timetable.selections[key] = selection
+        return selection
+
+    @staticmethod
+    def _filter(timetable, course, room):
+        """
+        Builds the (starts, lessons) of lowercased filters that are not in the course and room indexes.
         """
-        if self.df is None:
+        index, value = (timetable.by_course, course) if course is not None else (timetable.by_room, room)
+        if value in index:
+            lessons = index[value][1]
+        else:
+            groups = [index[key][1] for key in index if value in key]
+            lessons = list(heapq.merge(*groups, key=lambda lesson: lesson.start))
+
+        if course is not None and room is not None:
+            lessons = [lesson for lesson in lessons if room in lesson.room.lower()]
+        return [lesson.start for lesson in lessons], lessons
+
+    def _between(self, start, end, course=None, room=None):
+        """
+        Returns the lessons starting in [start, end).
+        """
+        starts, lessons = self._select(course, room)
+        return lessons[bisect.bisect_left(starts, start):bisect.bisect_left(starts, end)]
+
+    def _unavailable(self):
+        if not self.watching and self.poll_interval and time.monotonic() - self.checked_at >= self.poll_interval:
+            # No watcher in this process: the snapshot saved by the process running it is cheap to load
+            self.reload()
+        if self.error:
+            return self.error
+        if self.index is None:
             return "Timetable data is not available."
+        return None
+
+    @staticmethod
+    def _format(lesson):
+        return f"{lesson.course} {lesson.start.strftime('%d.%m.%Y')} klo {lesson.time} tilassa {lesson.room}"
 
-        try:
-            # Ensure required columns are present in the data
-            necessary_columns = ["Pvm", "Aika", "Kurssi", "Tila"]
-            if not all(col in self.df.columns for col in necessary_columns):
-                return "The timetable data is missing required columns."
-
-            # Drop rows with missing values in essential columns
-            self.df = self.df[necessary_columns].dropna(subset=necessary_columns)
-
-            # Convert the "Pvm" column to datetime format
-            self.df["Pvm"] = pd.to_datetime(self.df["Pvm"], errors="coerce", dayfirst=True)
-            now = datetime.now()
-
-            # Filter for upcoming classes based on the current date and time
-            upcoming_classes = self.df[self.df["Pvm"] >= now].sort_values(by=["Pvm", "Aika"]).head(1)
-
-            # Check if any upcoming class was found
-            if upcoming_classes.empty:
-                return "No upcoming classes were found in the timetable."
-
-            # Extract the details of the next class
-            next_class = upcoming_classes.iloc[0]
-            return (f"Seuraava luento: {next_class['Kurssi']} {next_class['Pvm'].strftime('%d.%m.%Y')} "
-                    f"klo {next_class['Aika']} tilassa {next_class['Tila']}.")
-        
-        except KeyError as e:
-            return f"Error: Required column missing - {e}"
-        except Exception as e:
-            return f"Error processing timetable data: {str(e)}"
+    def _format_list(self, title, lessons, empty):
+        if not lessons:
+            return empty
+        return title + "\n" + "\n".join(f"- {self._format(lesson)}" for lesson in lessons)
+
+    def get_next_class(self, course=None, room=None):
+        """
+        Returns information about the next upcoming class including date, time, course, and location.
+        """
+        unavailable = self._unavailable()
+        if unavailable:
+            return unavailable
+
+        next_classes = self._upcoming(1, course, room)
+        if not next_classes:
+            return "No upcoming classes were found in the timetable."
+        return f"Seuraava luento: {self._format(next_classes[0])}."
+
+    def _upcoming(self, count=3, course=None, room=None, now=None):
+        """
+        Returns the next count lessons that have not started yet.
+        """
+        starts, lessons = self._select(course, room)
+        i = bisect.bisect_left(starts, now or datetime.now())
+        return lessons[i:i + count]
+
+    def get_next_classes(self, count=3, course=None, room=None):
+        """
+        Returns the next count upcoming classes.
+        """
+        unavailable = self._unavailable()
+        if unavailable:
+            return unavailable
+        return self._format_list("Seuraavat luennot:", self._upcoming(count, course, room),
+                                 "No upcoming classes were found in the timetable.")
+
+    def get_classes_today(self, course=None, room=None):
+        """
+        Returns all of today's classes, including the ones that have already started.
+        """
+        unavailable = self._unavailable()
+        if unavailable:
+            return unavailable
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return self._format_list("Tämän päivän luennot:", self._between(today, today + timedelta(days=1), course, room),
+                                 "Tänään ei ole luentoja.")
+
+    def get_week_schedule(self, course=None, room=None):
+        """
+        Returns the classes of the current week from Monday to Sunday.
+        """
+        unavailable = self._unavailable()
+        if unavailable:
+            return unavailable
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        monday = today - timedelta(days=today.weekday())
+        return self._format_list("Tämän viikon luennot:", self._between(monday, monday + timedelta(days=7), course, room),
+                                 "Tällä viikolla ei ole luentoja.")
 
 # Example usage
 if __name__ == "__main__":
@@ -1,14 +1,85 @@
 
-from flask import Flask, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from twilio.twiml.messaging_response import MessagingResponse
 import requests
 from manager import Manager 
 from chatgpt import interpret_prompt  # Tuodaan interpret_prompt chatgpt.py:stä
+from intent_cache import IntentCache
+from storage import Storage
+from work_queue import WorkQueue, TwilioSender, StubSender
+from single_flight import SingleFlight, ResponseCache
+try:
+    from intent_router import IntentRouter, THRESHOLD as ROUTER_THRESHOLD
+except ModuleNotFoundError as e:  # NumPy not installed: every prompt goes to interpret_prompt
+    if e.name != "numpy":
+        raise
+    IntentRouter = None
+from tracing import span, count, log, new_request_id, render_metrics
+import os
 import json
+import time
+import queue
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 app = Flask(__name__)
 
-manager = Manager()
+# Structured JSON logs from tracing.log
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Bounded worker pool for running the tasks of one prompt in parallel
+TASK_WORKERS = 4
+TASK_TIMEOUT = 30  # seconds
+AGENT_TIMEOUTS = {
+    "menu_agent": 60,  # local Ollama RAG generation is slow on CPU
+}
+
+def parse_process_agents(value):
+    """
+    Parses SIHTEERI_AGENT_PROCESSES, e.g. "menu_agent=2,assignments_agent", into ProcessAgent
+    options: the number of worker processes (default 1) and the agent's call deadline.
+    """
+    process_agents = {}
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        name, _, workers = item.partition("=")
+        process_agents[name] = {"workers": int(workers or 1), "timeout": AGENT_TIMEOUTS.get(name, TASK_TIMEOUT)}
+    return process_agents
+
+# Agents listed in SIHTEERI_AGENT_PROCESSES run in worker processes. With SIHTEERI_PRELOAD=1 (set by
+# gunicorn.conf.py) the agents are loaded before the HTTP workers are forked, so they share them
+# copy-on-write; otherwise they are instantiated lazily and warmed up in the background unless
+# SIHTEERI_WARM_UP=0
+PRELOAD = os.environ.get("SIHTEERI_PRELOAD") == "1"
+manager = Manager(process_agents=parse_process_agents(os.environ.get("SIHTEERI_AGENT_PROCESSES", "")), preload=PRELOAD)
+if PRELOAD:
+    manager.warm_up(background=False)
+elif os.environ.get("SIHTEERI_WARM_UP", "1") == "1":
+    manager.warm_up(background=True)
+
+task_executor = ThreadPoolExecutor(max_workers=TASK_WORKERS, thread_name_prefix="task")
+
+# JSON API batches: prompts per request and how many of them are processed at once. The batches
+# share one pool, so its threads (and their database connections) are reused across requests.
+MAX_BATCH_PROMPTS = 100
+MAX_BATCH_CONCURRENCY = 8
+batch_executor = ThreadPoolExecutor(max_workers=MAX_BATCH_CONCURRENCY, thread_name_prefix="batch")
+
+# Concurrent identical work shares one in-flight computation: interpretations by normalized
+# prompt, agent calls by (agent, instructions) and webhook handling by Twilio's MessageSid
+interpret_flight = SingleFlight("interpret")
+task_flight = SingleFlight("task")
+message_flight = SingleFlight("message")
+
+# Rendered replies by MessageSid, so that Twilio's retries are not recomputed
+RESPONSE_TTL = 300  # seconds
+response_cache = ResponseCache(max_entries=1024, ttl=RESPONSE_TTL)
+
+# Agents that can stream their reply token by token, and the method that does it
+STREAMING_METHODS = {
+    "menu_agent": "stream_today_menu",
+}
 
 # System-prompt definition: instructs ChatGPT API to interpret user prompt
 def generate_system_prompt():
@@ -37,91 +108,392 @@ Palauta vain ne tehtävät, jotka ovat relevantteja käyttäjän promptin perust
     return system_prompt.strip()
 
 SYSTEM_PROMPT = generate_system_prompt()
+AGENTS_SIGNATURE = manager.get_agents_signature()
 
-@app.route("/whatsapp", methods=["POST"])
-def whatsapp_reply():
-    incoming_msg = request.form.get('Body', '').strip()
-    sender_number = request.form.get('From')
+# Cache for interpreted task lists, persisted so it survives restarts
+intent_cache = IntentCache(max_entries=512, ttl=24 * 3600, storage=Storage())
+
+# Local first-stage router: clear prompts skip interpret_prompt. SIHTEERI_ROUTER=0 disables it and
+# SIHTEERI_ROUTER_THRESHOLD tunes it (see benchmarks/router_eval.py)
+ROUTER_ENABLED = IntentRouter is not None and os.environ.get("SIHTEERI_ROUTER", "1") == "1"
+
+def build_router():
+    if not ROUTER_ENABLED:
+        return None
+    agents = {agent["name"]: agent["description"] for agent in manager.get_agents_list()}
+    threshold = float(os.environ.get("SIHTEERI_ROUTER_THRESHOLD", ROUTER_THRESHOLD))
+    return IntentRouter(agents, threshold=threshold)
+
+intent_router = build_router()
+
+# Asynchronous replies: set SIHTEERI_ASYNC=1 to answer webhooks out-of-band through a work queue,
+# and SIHTEERI_SENDER=stub to print the answers locally instead of sending them with Twilio
+ASYNC_REPLIES = os.environ.get("SIHTEERI_ASYNC") == "1"
+QUEUE_WORKERS = 2
+work_queue = WorkQueue(Storage()) if ASYNC_REPLIES else None
+
+def get_system_prompt():
+    """
+    Returns the current system prompt, regenerating it, rebuilding the router and invalidating
+    the intent cache if the agent set loaded by the manager has changed.
+    """
+    global SYSTEM_PROMPT, AGENTS_SIGNATURE, intent_router
+    signature = manager.get_agents_signature()
+    if signature != AGENTS_SIGNATURE:
+        SYSTEM_PROMPT = generate_system_prompt()
+        AGENTS_SIGNATURE = signature
+        intent_router = build_router()
+        intent_cache.invalidate(SYSTEM_PROMPT)
+        log("intent_cache_invalidated", reason="agent set changed")
+    return SYSTEM_PROMPT
+
+def interpret_tasks(prompt):
+    """
+    Interprets the user prompt into a task list, using the local router or the intent cache
+    when possible.
+    """
+    system_prompt = get_system_prompt()
+    if intent_router:
+        with span("router"):
+            decision = intent_router.route(prompt)
+        count("sihteeri_router_total", path=decision.path)
+        log("route", path=decision.path, scores=decision.scores)
+        if decision.task_list is not None:
+            return decision.task_list
+
+    with span("intent_cache.get"):
+        task_list = intent_cache.get(prompt, system_prompt)
+    if task_list is None:
+        count("sihteeri_intent_cache_total", result="miss")
+        key = (intent_cache.normalize(prompt), system_prompt)
+        task_list = interpret_flight.do(key, interpret_uncached, prompt, system_prompt)
+    else:
+        count("sihteeri_intent_cache_total", result="hit")
+    log("task_list", tasks=task_list.get("tasks", []), cache=intent_cache.stats())
+    return task_list
 
-    response_text = ""
+def interpret_uncached(prompt, system_prompt):
+    with span("interpret_prompt"):
+        task_list = json.loads(interpret_prompt(prompt, system_prompt))
+    intent_cache.put(prompt, system_prompt, task_list)
+    return task_list
 
-    # Direct handling for "score" command
+def run_task(task):
+    """
+    Executes a single task from the interpreted task list and returns the agent's reply.
+    """
+    agent_name = task.get("agent")
+    instructions = task.get("instructions")
+
+    # Find the agent by name
+    log("agent_lookup", agent=agent_name, instructions=instructions)
+    agent = manager.get_agent_by_name(agent_name)
+    if not agent:
+        return f"Agent {agent_name} ei ole tuettu."
+
+    if agent_name == "timetable_agent":
+        return agent.get_next_class()
+    elif agent_name == "menu_agent":
+        return agent.get_today_menu()
+    elif agent_name == "assignments_agent":
+        return agent.get_upcoming_assignments()
+    elif agent_name == "haiku_agent":
+        return agent.haiku()
+    return f"Agent {agent_name} ei ole tuettu."
+
+def submit_task(task):
+    """
+    Submits a task to the task pool, carrying over the request ID of the caller. An identical
+    task that is already running is shared instead of submitted again.
+    """
+    key = (task.get("agent"), intent_cache.normalize(task.get("instructions") or ""))
+    return task_flight.submit(key, task_executor, contextvars.copy_context().run, run_task, task)
+
+def run_tasks(tasks):
+    """
+    Runs all tasks concurrently on the task pool, each with its own timeout, and
+    combines the replies in task order. A failing or slow task yields an error line
+    instead of failing the whole response.
+    """
+    started = time.monotonic()
+    futures = [submit_task(task) for task in tasks]
+
+    replies = [collect_reply(task.get("agent"), future, started) for task, future in zip(tasks, futures)]
+    return "\n\n".join(reply for reply in replies if reply)
+
+def collect_reply(agent_name, future, started):
+    """
+    Waits for a task submitted at started (time.monotonic) until the agent's timeout and
+    returns its reply, or an error line if the task failed or timed out.
+    """
+    deadline = started + AGENT_TIMEOUTS.get(agent_name, TASK_TIMEOUT)
+    try:
+        reply = future.result(timeout=max(0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        reply = f"Agent {agent_name} ei vastannut ajoissa."
+    except Exception as e:
+        reply = f"Error from {agent_name}: {str(e)}"
+    log("agent_response", agent=agent_name, reply=reply)
+    return reply
+
+def process_prompt(incoming_msg):
+    """
+    Produces the reply text for an incoming user message.
+    """
+    # Direct handling for the "score" command. Scoring every answer is a batch job for the
+    # command line (python agents/assignments_agent.py score_all), not for a webhook
     if incoming_msg.startswith("score ") or incoming_msg.startswith("arvioi "):
-        task_name = incoming_msg[len("score "):].strip()
+        task_name = incoming_msg.split(" ", 1)[1].strip()
         agent = manager.get_agent_by_name("assignments_agent")
-        response_text = agent.score(task_name)
-        response = MessagingResponse()
-        response.message(response_text)
-        return str(response)
+        if not agent:
+            return "Agent assignments_agent ei ole käytettävissä."
+        try:
+            return agent.score(task_name)
+        except Exception as e:
+            log("score_failed", task=task_name, error=str(e))
+            return f"Error scoring {task_name}: {str(e)}"
 
     elif incoming_msg == "list_agents":
         agents_list = manager.get_agents_list()
-        response_text = "Käytettävissä olevat agentit:\n" + "\n".join([f"{agent['name']} - {agent['description']}" for agent in agents_list])
-        response = MessagingResponse()
-        response.message(response_text)
-        return str(response)
+        return "Käytettävissä olevat agentit:\n" + "\n".join([f"{agent['name']} - {agent['description']}" for agent in agents_list])
+
+    log("prompt", prompt=incoming_msg)
+    try:
+        # Interpret user prompt with ChatGPT API (or the intent cache)
+        task_list = interpret_tasks(incoming_msg)
 
-    elif incoming_msg == "system_prompt":
-        return SYSTEM_PROMPT, 200
+        # Execute all tasks concurrently and merge the replies in task order
+        with span("dispatch"):
+            return run_tasks(task_list.get("tasks", []))
 
-    else:
-        print("Processing user prompt:", incoming_msg)
+    except Exception as e:
+        log("prompt_failed", error=str(e))
+        return f"Error processing your prompt: {str(e)}"
+
+class StreamError(str):
+    """
+    An error line in a streamed reply, sent to the client as an error event.
+    """
+
+def stream_task(agent_name, tokens):
+    """
+    Yields the tokens of a streaming agent call, raising TimeoutError when the agent sends no
+    token within its timeout. The call is iterated on its own thread, so a hung stream does not
+    hold the request thread; it is closed once its next token arrives.
+    """
+    timeout = AGENT_TIMEOUTS.get(agent_name, TASK_TIMEOUT)
+    items = queue.Queue()
+    cancelled = threading.Event()
+
+    def produce():
         try:
-            # Interpret user prompt with ChatGPT API
-            task_list = json.loads(interpret_prompt(incoming_msg, SYSTEM_PROMPT))
-            print("Task list:", task_list)
-
-            # Debugging: Print available agents
-            print("Available agents:", manager.get_agents_list())
-            
-            # Loop through task list and execute agent instructions
-            for task in task_list.get("tasks", []):
-                agent_name = task["agent"]
-                instructions = task["instructions"]
-                
-                # Find the agent by name
-                print("Looking for agent by name:", agent_name)
-                agent = manager.get_agent_by_name(agent_name)
-                
-                if agent:
-                    print("Agent found:", agent_name)
-
-                    if agent_name == "timetable_agent":
-                        print("Getting next class info")
-                        response_text = agent.get_next_class()  # timetable_agent function call
-                        print("Response from agent:", response_text)
-                        break
-                    
-                    elif agent_name == "menu_agent":
-                        print("Getting today's menu")
-                        response_text = agent.get_today_menu()  # menu_agent function call
-                        print("Response from agent:", response_text)
-                        break
-
-                    elif agent_name == "assignments_agent":
-                        response_text = agent.get_upcoming_assignments()
-                        break
-
-                    elif agent_name == "haiku_agent":
-                        response_text = agent.haiku()
-                        break
-
-                else:
-                    response_text = f"Agent {agent_name} ei ole tuettu."
+            for token in tokens:
+                if cancelled.is_set():
+                    break
+                items.put((True, token))
+            items.put((False, None))
+        except Exception as e:
+            items.put((False, e))
+        finally:
+            tokens.close()
+
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                     name=f"stream-{agent_name}", daemon=True).start()
+    try:
+        while True:
+            try:
+                more, item = items.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"no token from {agent_name} in {timeout} s") from None
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        cancelled.set()
+
+def stream_prompt(incoming_msg):
+    """
+    Yields the reply for an incoming user message in pieces: tokens from streaming agents
+    as they are generated, and whole replies from the other agents. Failed and timed-out
+    streams yield a StreamError.
+    """
+    if incoming_msg.startswith(("score ", "arvioi ")) or incoming_msg == "list_agents":
+        yield process_prompt(incoming_msg)
+        return
+
+    log("prompt", prompt=incoming_msg, streaming=True)
+    try:
+        tasks = interpret_tasks(incoming_msg).get("tasks", [])
+    except Exception as e:
+        yield f"Error processing your prompt: {str(e)}"
+        return
+
+    # Non-streaming tasks run concurrently while the streaming ones are streamed in task order
+    started = time.monotonic()
+    futures = {
+        i: submit_task(task)
+        for i, task in enumerate(tasks) if task.get("agent") not in STREAMING_METHODS
+    }
+    for i, task in enumerate(tasks):
+        agent_name = task.get("agent")
+        if i > 0:
+            yield "\n\n"
+        if i in futures:
+            yield collect_reply(agent_name, futures[i], started)
+            continue
 
+        agent = manager.get_agent_by_name(agent_name)
+        if not agent:
+            yield f"Agent {agent_name} ei ole tuettu."
+            continue
+        try:
+            for token in stream_task(agent_name, getattr(agent, STREAMING_METHODS[agent_name])()):
+                yield token
+        except TimeoutError as e:
+            log("agent_timeout", agent=agent_name, error=str(e))
+            yield StreamError(f"Agent {agent_name} ei vastannut ajoissa.")
         except Exception as e:
-            response_text = f"Error processing your prompt: {str(e)}"
+            yield StreamError(f"Error from {agent_name}: {str(e)}")
 
-        # Twilio response        
-        #response = MessagingResponse()
-        #response.message(response_text)
-        #return str(response)
-        response = MessagingResponse()
-        response.message(response_text)
-        print("Twilio Response Body:", str(response))
-        return str(response)
+@app.route("/stream", methods=["POST"])
+def stream_reply():
+    """
+    Streams the reply as server-sent events: one {"token": ...} data event per piece and an
+    error event ({"error": ...}) for a failed or timed-out agent, followed by a done event.
+    """
+    incoming_msg = request.form.get('Body', '').strip()
+    new_request_id()
+    count("sihteeri_requests_total", route="stream")
+
+    def events():
+        for token in stream_prompt(incoming_msg):
+            if isinstance(token, StreamError):
+                yield f"event: error\ndata: {json.dumps({'error': token})}\n\n"
+            else:
+                yield f"data: {json.dumps({'token': token})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Exposes the latency histograms and counters in the Prometheus text format.
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+def api_error(message, status=400):
+    return jsonify({"error": message}), status
 
+def process_api_prompt(prompt):
+    """
+    Processes one prompt of the JSON API under its own request ID.
+    """
+    request_id = new_request_id()
+    with span("route.api"):
+        try:
+            return {"prompt": prompt, "reply": process_prompt(prompt), "request_id": request_id}
+        except Exception as e:
+            log("prompt_failed", error=str(e))
+            return {"prompt": prompt, "error": str(e), "request_id": request_id}
+
+@app.route("/api/prompt", methods=["POST"])
+def api_prompt():
+    """
+    Answers a single prompt: {"prompt": "..."} -> {"prompt", "reply", "request_id"}.
+    """
+    payload = request.get_json(silent=True) or {}
+    prompt = payload.get("prompt")
+    if not isinstance(prompt, str) or not prompt.strip():
+        return api_error("Field 'prompt' must be a non-empty string.")
+    count("sihteeri_requests_total", route="api_prompt")
+    return jsonify(process_api_prompt(prompt.strip()))
+
+@app.route("/api/batch", methods=["POST"])
+def api_batch():
+    """
+    Answers many prompts concurrently: {"prompts": [...], "concurrency": 4} -> {"results": [...]},
+    with the results in prompt order.
+    """
+    payload = request.get_json(silent=True) or {}
+    prompts = payload.get("prompts")
+    if not isinstance(prompts, list) or not prompts or not all(isinstance(prompt, str) for prompt in prompts):
+        return api_error("Field 'prompts' must be a non-empty list of strings.")
+    if len(prompts) > MAX_BATCH_PROMPTS:
+        return api_error(f"At most {MAX_BATCH_PROMPTS} prompts per batch.")
+    try:
+        concurrency = min(max(int(payload.get("concurrency", 4)), 1), MAX_BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        return api_error("Field 'concurrency' must be an integer.")
+    count("sihteeri_requests_total", route="api_batch")
 
+    # Each prompt runs in a copy of this context so that its request ID stays its own. At most
+    # concurrency prompts of this batch are in the shared pool at a time.
+    slots = threading.BoundedSemaphore(concurrency)
+    futures = []
+    for prompt in prompts:
+        slots.acquire()
+        future = batch_executor.submit(contextvars.copy_context().run, process_api_prompt, prompt.strip())
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    return jsonify({"results": [future.result() for future in futures]})
+
+@app.route("/api/agents", methods=["GET"])
+def api_agents():
+    return jsonify({"agents": manager.get_agents_list()})
+
+@app.route("/api/system_prompt", methods=["GET"])
+def api_system_prompt():
+    return jsonify({"system_prompt": get_system_prompt()})
+
+@app.route("/whatsapp", methods=["POST"])
+def whatsapp_reply():
+    incoming_msg = request.form.get('Body', '').strip()
+    sender_number = request.form.get('From')
+    message_sid = request.form.get('MessageSid')
+    new_request_id()
+    count("sihteeri_requests_total", route="whatsapp")
+
+    if incoming_msg == "system_prompt":
+        return get_system_prompt(), 200
+
+    # Asynchronous mode: acknowledge immediately and deliver the answer out-of-band
+    if work_queue and message_sid:
+        if not work_queue.enqueue(message_sid, sender_number, request.form.get('To'), incoming_msg):
+            log("duplicate_message", message_sid=message_sid)
+        return str(MessagingResponse())
+
+    if not message_sid:
+        return render_reply(incoming_msg)
+
+    # Twilio re-POSTs the message when the webhook is slow; answer retries from the response cache
+    # or from the computation that is still in flight
+    body = response_cache.get(message_sid)
+    if body is not None:
+        count("sihteeri_response_cache_hits_total")
+        log("duplicate_message", message_sid=message_sid)
+        return body
+    return message_flight.do(message_sid, render_cached_reply, message_sid, incoming_msg)
+
+def render_cached_reply(message_sid, incoming_msg):
+    body = render_reply(incoming_msg)
+    response_cache.put(message_sid, body)
+    return body
+
+def render_reply(incoming_msg):
+    with span("route.whatsapp"):
+        response_text = process_prompt(incoming_msg)
+
+    # Twilio response
+    with span("twiml"):
+        response = MessagingResponse()
+        response.message(response_text)
+        body = str(response)
+    log("twilio_response", body=body)
+    return body
 
 def print_public_ip():
     try:
@@ -130,6 +502,25 @@ def print_public_ip():
     except requests.RequestException as e:
         print(f"Julkisen IP-osoitteen hakeminen epäonnistui: {e}")
 
+def process_queued_prompt(incoming_msg):
+    new_request_id()
+    with span("route.queue"):
+        return process_prompt(incoming_msg)
+
+def start_queue_workers():
+    sender = StubSender() if os.environ.get("SIHTEERI_SENDER") == "stub" else TwilioSender()
+    work_queue.start_workers(process_queued_prompt, sender, count=QUEUE_WORKERS)
+
+def after_fork():
+    """
+    Starts the per-process parts of a preloaded app in a forked HTTP worker.
+    """
+    manager.after_fork()
+    if work_queue:
+        start_queue_workers()
+
 if __name__ == "__main__":
     print_public_ip() 
+    if work_queue:
+        start_queue_workers()
     app.run(host="0.0.0.0", port=5000)
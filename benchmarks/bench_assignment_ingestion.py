@@ -0,0 +1,147 @@
+# benchmarks/bench_assignment_ingestion.py
+"""
+Compares the old per-file assignment ingestion (SELECT + UPDATE/INSERT per file, on the original
+Storage that opens a connection per call and commits every statement) with the batched upsert in
+AssignmentsAgent, using synthetic assignment and answer files.
+
+Usage:
+    python benchmarks/bench_assignment_ingestion.py [file_count]
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")  # chatgpt.py requires a key at import time
+
+from storage import Storage
+from agents.assignments_agent import AssignmentsAgent
+
+ASSIGNMENTS_SCHEMA = {
+    "table": "assignments",
+    "fields": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "title": "TEXT NOT NULL",
+        "due_date": "TEXT NOT NULL",
+        "status": "TEXT NOT NULL DEFAULT 'pending'"
+    },
+    "constraints": ["UNIQUE(title, due_date)"]
+}
+
+class LegacyStorage:
+    """
+    The parts of Storage used by legacy_ingest as they were before connections were kept per
+    thread: every call opens a new connection in the default rollback-journal mode and commits.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def execute_query(self, query, params=None):
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params or ())
+            conn.commit()
+            return cursor.fetchall()
+
+    def insert_data(self, table, data, unique_columns=None):
+        if unique_columns:
+            where_clause = " AND ".join([f"{col} = ?" for col in unique_columns])
+            check_query = f"SELECT id FROM {table} WHERE {where_clause}"
+            if self.execute_query(check_query, tuple(data[col] for col in unique_columns)):
+                return f"Duplicate entry detected in {table} for {unique_columns}."
+
+        columns = ', '.join(data.keys())
+        placeholders = ', '.join(['?'] * len(data))
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(data.values()))
+            conn.commit()
+            return cursor.lastrowid
+
+    def update_data(self, table, data, where_clause, where_args):
+        columns = ', '.join([f"{col} = ?" for col in data.keys()])
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"UPDATE {table} SET {columns} WHERE {where_clause}", tuple(data.values()) + where_args)
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def create_table(self, schema):
+        fields = ', '.join([f"{field} {type}" for field, type in schema["fields"].items()])
+        constraints = ', '.join(schema.get("constraints", []))
+        self.execute_query(f"CREATE TABLE IF NOT EXISTS {schema['table']} ({fields} {', ' if constraints else ''}{constraints})")
+
+def create_files(root, count):
+    assignments_folder = os.path.join(root, "assignments")
+    answers_folder = os.path.join(root, "answers")
+    os.makedirs(assignments_folder)
+    os.makedirs(answers_folder)
+
+    start = date(2026, 1, 1)
+    for i in range(count):
+        title = f"task{i:05d}"
+        due_date = (start + timedelta(days=i % 365)).strftime("%Y-%m-%d")
+        with open(os.path.join(assignments_folder, f"{title}_{due_date}"), "w", encoding="utf-8") as f:
+            f.write(f"Assignment {i}")
+        # Every other assignment has been answered
+        if i % 2 == 0:
+            with open(os.path.join(answers_folder, title), "w", encoding="utf-8") as f:
+                f.write(f"Answer {i}")
+    return assignments_folder, answers_folder
+
+def legacy_ingest(storage, assignments_folder, answers_folder):
+    """
+    The per-file ingestion used before upsert_many.
+    """
+    assignments_files = os.listdir(assignments_folder)
+    answers_files = os.listdir(answers_folder)
+    for filename in assignments_files:
+        title, due_date_str = filename.rsplit('_', 1)
+        due_date = datetime.strptime(due_date_str, "%Y-%m-%d").strftime("%Y-%m-%d")
+        new_status = "submitted" if title in answers_files else "pending"
+        existing_assignment = storage.execute_query(
+            "SELECT id, status FROM assignments WHERE title = ? AND due_date = ?", (title, due_date)
+        )
+        if existing_assignment:
+            assignment_id, current_status = existing_assignment[0]
+            if current_status != new_status:
+                storage.update_data("assignments", {"status": new_status}, "id = ?", (assignment_id,))
+        else:
+            data = {"title": title, "due_date": due_date, "status": new_status}
+            storage.insert_data("assignments", data, unique_columns=["title", "due_date"])
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+def main(count):
+    with tempfile.TemporaryDirectory() as root:
+        assignments_folder, answers_folder = create_files(root, count)
+
+        legacy_storage = LegacyStorage(os.path.join(root, "legacy.db"))
+        legacy_storage.create_table(ASSIGNMENTS_SCHEMA)
+        legacy_cold = timed(lambda: legacy_ingest(legacy_storage, assignments_folder, answers_folder))
+        legacy_warm = timed(lambda: legacy_ingest(legacy_storage, assignments_folder, answers_folder))
+
+        batch_storage = Storage(os.path.join(root, "batch.db"))
+        make_agent = lambda: AssignmentsAgent(assignments_folder, answers_folder, storage=batch_storage, poll_interval=None)
+        batch_cold = timed(make_agent)
+        batch_warm = timed(make_agent)
+
+        print(f"{count} assignment files")
+        print(f"{'':<12}{'legacy':>10}{'batched':>10}{'speed-up':>10}")
+        print(f"{'cold start':<12}{legacy_cold:>9.2f}s{batch_cold:>9.2f}s{legacy_cold / batch_cold:>9.1f}x")
+        print(f"{'warm start':<12}{legacy_warm:>9.2f}s{batch_warm:>9.2f}s{legacy_warm / batch_warm:>9.1f}x")
+
+        batch_storage.close()
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,114 @@
+# benchmarks/bench_retriever.py
+"""
+Compares the OllamaRAG retriever backends, the in-process VectorIndex (with and without BM25)
+and Chroma, on synthetic menu chunks embedded by the fake Ollama server: import and indexing
+time, median retrieval latency and the resident memory the backend adds. Each backend runs in
+a fresh interpreter so that their imports and memory do not mix.
+
+Usage:
+    python benchmarks/bench_retriever.py [--chunks 1,100,5000] [--queries 200]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = {
+    "index": {"backend": "index", "bm25_weight": 0.0},
+    "index+bm25": {"backend": "index", "bm25_weight": 0.3},
+    "chroma": {"backend": "chroma", "bm25_weight": 0.0},
+}
+QUERIES = ["What is for lunch today?", "Mitä ruokana tänään?", "Onko tänään lohikeittoa?", "Show the menu for Friday"]
+
+def rss_mb():
+    """
+    Returns the resident set size of this process in MB.
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak, not current, outside Linux
+
+def run_backend(name, chunk_count, query_count):
+    """
+    Measures one backend in this process and prints the results as JSON.
+    """
+    from fake_servers import start_fake_servers, fake_environment
+
+    fake_server, fake_url = start_fake_servers(ollama_latency=0.0, embedding_latency=0.0)
+    os.environ.update(fake_environment(fake_url))
+    baseline = rss_mb()
+
+    with tempfile.TemporaryDirectory(prefix="sihteeri-retriever-") as workdir:
+        os.chdir(workdir)  # The embedding cache database is created in the working directory
+        started = time.perf_counter()
+        from langchain_core.documents import Document
+        from ollama_rag import OllamaRAG
+        rag = OllamaRAG(persist_directory=os.path.join(workdir, "index"), **BACKENDS[name])
+        docs = [Document(page_content=f"{i % 28 + 1}.{i // 28 % 12 + 1}.2026: Lohikeittoa, ruisleipää ja "
+                                      f"puolukkapuuroa, kasvisvaihtoehtona linssipata (osa {i})",
+                         metadata={"source": "menub.txt"})
+                for i in range(chunk_count)]
+        rag.setup_documents(docs)
+        setup_seconds = time.perf_counter() - started
+
+        # Warm up the query embeddings, so the timings measure the search itself
+        for query in QUERIES:
+            rag.retriever.invoke(query)
+        timings = []
+        for i in range(query_count):
+            started = time.perf_counter()
+            rag.retriever.invoke(QUERIES[i % len(QUERIES)])
+            timings.append(time.perf_counter() - started)
+        os.chdir(ROOT)
+
+    fake_server.shutdown()
+    print(json.dumps({
+        "setup_ms": setup_seconds * 1e3,
+        "p50_ms": statistics.median(timings) * 1e3,
+        "p95_ms": statistics.quantiles(timings, n=20)[-1] * 1e3 if len(timings) > 1 else timings[0] * 1e3,
+        "rss_mb": rss_mb() - baseline,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="1,100,5000", help="comma-separated corpus sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--run", nargs=2, metavar=("BACKEND", "CHUNKS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_backend(args.run[0], int(args.run[1]), args.queries)
+        return
+
+    print(f"{'backend':<12}{'chunks':>8}{'setup ms':>12}{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>10}")
+    for chunk_count in [int(value) for value in args.chunks.split(",")]:
+        for name in args.backends.split(","):
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", name, str(chunk_count), "--queries", str(args.queries)],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else completed.returncode
+                print(f"{name:<12}{chunk_count:>8}  failed: {error}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{name:<12}{chunk_count:>8}{result['setup_ms']:>12.1f}{result['p50_ms']:>10.3f}"
+                  f"{result['p95_ms']:>10.3f}{result['rss_mb']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# benchmarks/fake_servers.py
+"""
+Local stand-ins for the external services Sihteeri talks to, for benchmarks without live
+OpenAI, Ollama or Twilio accounts. All of them run in one threaded HTTP server:
+
+- OpenAI chat completions:  POST /v1/chat/completions
+- Ollama chat:              POST /api/chat (streamed NDJSON unless "stream": false)
+- Ollama embeddings:        POST /api/embeddings and POST /api/embed
+- Twilio messages:          POST /2010-04-01/Accounts/<sid>/Messages.json
+- Menu document:            GET /menub.txt
+
+Usage:
+    python benchmarks/fake_servers.py [--port 8099] [--openai-latency 0.3] [--ollama-latency 1.0]
+"""
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+EMBEDDING_DIMENSIONS = 64
+
+# Canned task lists, chosen by keywords in the user prompt
+CANNED_TASKS = [
+    (("ruoka", "lounas", "lunch", "menu"), {"agent": "menu_agent", "instructions": "Return today's lunch menu"}),
+    (("luento", "luokka", "class", "lukkari"), {"agent": "timetable_agent", "instructions": "Return the next class"}),
+    (("tehtävä", "tehtävät", "assignment", "deadline"), {"agent": "assignments_agent", "instructions": "List upcoming assignments"}),
+    (("haiku", "runo", "poem"), {"agent": "haiku_agent", "instructions": "Write a haiku"}),
+]
+
+def make_menu(days=14):
+    """
+    Returns a synthetic lunch menu document covering the next days.
+    """
+    lines = []
+    today = datetime.now()
+    for i in range(days):
+        date = (today + timedelta(days=i)).strftime("%d.%m.%Y")
+        lines.append(f"{date}: Lohikeittoa, ruisleipää ja puolukkapuuroa (päivä {i + 1})")
+    return "\n".join(lines)
+
+def fake_embedding(text):
+    """
+    Returns a deterministic unit vector derived from the text hash.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.uniform(-1.0, 1.0) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+class FakeServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = {"openai_latency": 0.3, "ollama_latency": 1.0, "embedding_latency": 0.02, "menu": make_menu()}
+    stats = {"requests": {}}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats["requests"][name] = self.stats["requests"].get(name, 0) + 1
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body, content_type="application/json"):
+        data = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload, ensure_ascii=False))
+
+    def do_GET(self):
+        if self.path.startswith("/menub.txt"):
+            self._count("menu")
+            self._send(200, self.config["menu"], "text/plain; charset=utf-8")
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path.startswith("/v1/chat/completions"):
+            self._openai_chat(json.loads(body))
+        elif self.path.startswith("/api/chat"):
+            self._ollama_chat(json.loads(body))
+        elif self.path.startswith("/api/embeddings"):
+            self._count("ollama_embeddings")
+            time.sleep(self.config["embedding_latency"])
+            self._send_json({"embedding": fake_embedding(json.loads(body)["prompt"])})
+        elif self.path.startswith("/api/embed"):
+            self._count("ollama_embed")
+            inputs = json.loads(body)["input"]
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            time.sleep(self.config["embedding_latency"])
+            self._send_json({"embeddings": [fake_embedding(text) for text in inputs]})
+        elif re.match(r"/2010-04-01/Accounts/[^/]+/Messages\.json", self.path):
+            self._twilio_message(parse_qs(body.decode("utf-8")))
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _openai_chat(self, payload):
+        self._count("openai_chat")
+        time.sleep(self.config["openai_latency"])
+        system = next((m["content"] for m in payload["messages"] if m["role"] == "system"), "")
+        prompt = next((m["content"] for m in reversed(payload["messages"]) if m["role"] == "user"), "")
+
+        if "JSON" in system and "tasks" in system:
+            lowered = prompt.lower()
+            tasks = [task for keywords, task in CANNED_TASKS if any(keyword in lowered for keyword in keywords)]
+            content = json.dumps({"tasks": tasks}, ensure_ascii=False)
+        else:
+            content = "An old silent pond\nA frog jumps into the pond\nSplash! Silence again"
+
+        self._send_json({
+            "id": f"chatcmpl-{random.getrandbits(48):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-3.5-turbo"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    def _ollama_chat(self, payload):
+        self._count("ollama_chat")
+        tokens = "Tänään lounaaksi on lohikeittoa, ruisleipää ja puolukkapuuroa .".split(" ")
+        model = payload.get("model", "llama3.2")
+
+        if payload.get("stream") is False:
+            time.sleep(self.config["ollama_latency"])
+            self._send_json({"model": model, "message": {"role": "assistant", "content": " ".join(tokens)}, "done": True})
+            return
+
+        # Stream NDJSON lines, spreading the latency over the tokens
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        delay = self.config["ollama_latency"] / (len(tokens) + 1)
+        for i, token in enumerate(tokens):
+            time.sleep(delay)
+            self._write_chunk({"model": model, "message": {"role": "assistant", "content": token + " "}, "done": False})
+        self._write_chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _twilio_message(self, form):
+        self._count("twilio_messages")
+        self._send_json({
+            "sid": f"SM{random.getrandbits(128):032x}",
+            "to": form.get("To", [""])[0],
+            "from": form.get("From", [""])[0],
+            "body": form.get("Body", [""])[0],
+            "status": "queued"
+        }, status=201)
+
+def start_fake_servers(port=0, openai_latency=0.3, ollama_latency=1.0, embedding_latency=0.02):
+    """
+    Starts the fake services in a background thread.
+
+    Returns:
+        tuple: (server, base_url). Call server.shutdown() to stop.
+    """
+    FakeServiceHandler.config.update(
+        openai_latency=openai_latency, ollama_latency=ollama_latency, embedding_latency=embedding_latency
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeServiceHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-servers", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def fake_environment(base_url):
+    """
+    Returns the environment variables that point Sihteeri at the fake services.
+    """
+    return {
+        "OPENAI_API_KEY": "fake-key",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OLLAMA_BASE_URL": base_url,
+        "TWILIO_ACCOUNT_SID": "ACfake",
+        "TWILIO_AUTH_TOKEN": "fake-token",
+        "TWILIO_BASE_URL": base_url,
+        "SIHTEERI_MENU_URL": f"{base_url}/menub.txt",
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--ollama-latency", type=float, default=1.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_servers(args.port, args.openai_latency, args.ollama_latency, args.embedding_latency)
+    print(f"Fake services listening on {base_url}. Environment:")
+    for key, value in fake_environment(base_url).items():
+        print(f"  {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
@@ -0,0 +1,183 @@
+# benchmarks/load_test.py
+"""
+Offline load test for backend.py. Starts the fake OpenAI/Ollama/Twilio services from
+fake_servers.py, runs the Flask app in-process on synthetic course data, drives /whatsapp
+(and optionally /stream) with a realistic prompt mix at a fixed concurrency, and reports
+p50/p95/p99 latency and requests per second per route and per agent.
+
+Usage:
+    python benchmarks/load_test.py [--requests 500] [--concurrency 8] [--routes whatsapp,stream]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import http.client
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_servers import start_fake_servers, fake_environment
+
+# (agent label, prompt variants, weight): lunch and next class dominate real traffic
+PROMPT_MIX = [
+    ("menu_agent", ["Mitä ruokana tänään?", "mitä ruokana tänään", "Mikä on päivän lounas?"], 4),
+    ("timetable_agent", ["Milloin on seuraava luento?", "seuraava luento", "Missä luokassa on seuraava luento?"], 4),
+    ("assignments_agent", ["Mitkä tehtävät ovat tulossa?", "Onko minulla tehtäviä tällä viikolla?"], 2),
+    ("haiku_agent", ["Kirjoita haiku", "Kirjoita minulle runo (haiku)"], 1),
+    ("multi", ["Seuraava luento ja mitä ruokana tänään?"], 2),
+]
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def create_course_data(root, assignments=200, lessons=2000):
+    """
+    Creates synthetic assignments, answers and a timetable CSV under root.
+    """
+    assignments_folder = os.path.join(root, "assignments")
+    answers_folder = os.path.join(root, "answers")
+    os.makedirs(assignments_folder)
+    os.makedirs(answers_folder)
+    today = datetime.now()
+    for i in range(assignments):
+        due_date = (today + timedelta(days=i % 30 - 5)).strftime("%Y-%m-%d")
+        with open(os.path.join(assignments_folder, f"tehtava{i:04d}_{due_date}"), "w", encoding="utf-8") as f:
+            f.write(f"Tehtävä {i}: selitä käsite {i}.")
+        if i % 3 == 0:
+            with open(os.path.join(answers_folder, f"tehtava{i:04d}"), "w", encoding="utf-8") as f:
+                f.write(f"Vastaus tehtävään {i}.")
+
+    start = today - timedelta(days=lessons // 8)
+    with open(os.path.join(root, "lukkari.csv"), "w", encoding="utf-8") as f:
+        f.write("Viikko;Päivä;Pvm;Aika;Kurssi;Tila;Tiimi;Opettaja\n")
+        for i in range(lessons):
+            day = start + timedelta(days=i // 4)
+            hour = 8 + 2 * (i % 4)
+            f.write(f"{day.isocalendar()[1]};{day.strftime('%a')};{day.strftime('%d.%m.%Y')};"
+                    f"{hour}.15-{hour + 1}.45;Kurssi {i % 12};A{i % 20};T{i % 3};Opettaja {i % 7}\n")
+
+def wait_for_agents(manager, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if all(data["instance"] is not None or data["error"] for data in manager.agents.values()):
+            break
+        time.sleep(0.2)
+    print(manager.get_startup_report())
+
+class Driver:
+    """
+    Sends requests over one persistent HTTP connection per worker thread.
+    """
+
+    def __init__(self, base_url):
+        parsed = urlparse(base_url)
+        self.host, self.port = parsed.hostname, parsed.port
+        self.local = threading.local()
+
+    def _connection(self):
+        if getattr(self.local, "conn", None) is None:
+            self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        return self.local.conn
+
+    def send(self, route, label, prompt, message_id):
+        body = urlencode({"Body": prompt, "From": "whatsapp:+358400000000", "To": "whatsapp:+14155238886"})
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        started = time.perf_counter()
+        first_token = None
+        try:
+            conn = self._connection()
+            conn.request("POST", f"/{route}", body=body, headers=headers)
+            response = conn.getresponse()
+            if route == "stream":
+                while True:
+                    line = response.readline()
+                    if not line:
+                        break
+                    if first_token is None and line.startswith(b"data: "):
+                        first_token = time.perf_counter() - started
+            else:
+                response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            self.local.conn = None
+            ok = False
+        return route, label, time.perf_counter() - started, first_token, ok
+
+def report(results, elapsed):
+    def line(name, rows):
+        latencies = [row[2] for row in rows]
+        errors = sum(1 for row in rows if not row[4])
+        ttfts = [row[3] for row in rows if row[3] is not None]
+        ttft = f"{percentile(ttfts, 0.5) * 1000:>9.0f}" if ttfts else f"{'-':>9}"
+        print(f"{name:<28}{len(rows):>7}{errors:>7}{len(rows) / elapsed:>9.1f}"
+              f"{percentile(latencies, 0.5) * 1000:>9.0f}{percentile(latencies, 0.95) * 1000:>9.0f}"
+              f"{percentile(latencies, 0.99) * 1000:>9.0f}{ttft}")
+
+    print(f"\n{'':<28}{'count':>7}{'errors':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttft ms':>9}")
+    line("all", results)
+    for route in sorted({row[0] for row in results}):
+        route_rows = [row for row in results if row[0] == route]
+        line(f"/{route}", route_rows)
+        for label in sorted({row[1] for row in route_rows}):
+            line(f"  {label}", [row for row in route_rows if row[1] == label])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--routes", default="whatsapp", help="comma-separated: whatsapp,stream")
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--ollama-latency", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    fake_server, fake_url = start_fake_servers(openai_latency=args.openai_latency, ollama_latency=args.ollama_latency)
+    workdir = tempfile.mkdtemp(prefix="sihteeri-load-")
+    create_course_data(workdir)
+    os.environ.update(fake_environment(fake_url))
+    os.environ["SIHTEERI_DATA_DIR"] = workdir
+    os.chdir(workdir)  # SQLite database and vector store go to the temporary directory
+
+    from werkzeug.serving import make_server
+    import backend
+
+    wait_for_agents(backend.manager, timeout=300)
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="backend", daemon=True).start()
+    driver = Driver(f"http://127.0.0.1:{server.server_port}")
+
+    rng = random.Random(args.seed)
+    routes = args.routes.split(",")
+    labels = [item for item in PROMPT_MIX for _ in range(item[2])]
+    workload = []
+    for i in range(args.requests):
+        label, prompts, _ = rng.choice(labels)
+        workload.append((rng.choice(routes), label, rng.choice(prompts), i))
+
+    print(f"\nSending {args.requests} requests at concurrency {args.concurrency} to {', '.join(routes)}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda item: driver.send(*item), workload))
+    elapsed = time.perf_counter() - started
+
+    report(results, elapsed)
+    print("\nUpstream calls:", fake_server.RequestHandlerClass.stats["requests"])
+    server.shutdown()
+    fake_server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/microbench.py
+"""
+Microbenchmarks for the hot paths: Storage queries, TimetableAgent lookups and
+OllamaRAG.query against the fake Ollama server. Prints the median time per call.
+
+Usage:
+    python benchmarks/microbench.py [storage] [timetable] [rag]
+"""
+import os
+import sys
+import time
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_servers import start_fake_servers, fake_environment
+from load_test import create_course_data
+
+def bench(name, fn, number=1000, repeat=5):
+    """
+    Runs fn number times per repeat and prints the median time per call.
+    """
+    fn()  # Warm up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - started) / number)
+    median = statistics.median(timings)
+    unit, scale = ("ms", 1e3) if median >= 1e-3 else ("µs", 1e6)
+    print(f"{name:<45}{median * scale:>10.1f} {unit}")
+
+def bench_storage(workdir):
+    from storage import Storage
+
+    storage = Storage(os.path.join(workdir, "bench.db"))
+    storage.create_table({
+        "table": "assignments",
+        "fields": {
+            "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+            "title": "TEXT NOT NULL",
+            "due_date": "TEXT NOT NULL",
+            "status": "TEXT NOT NULL DEFAULT 'pending'"
+        },
+        "constraints": ["UNIQUE(title, due_date)"]
+    })
+    today = datetime.now()
+    rows = [{"title": f"task{i}", "due_date": (today + timedelta(days=i % 60)).strftime("%Y-%m-%d"), "status": "pending"}
+            for i in range(5000)]
+    storage.upsert_many("assignments", rows, conflict_columns=["title", "due_date"])
+
+    counter = iter(range(10 ** 9))
+    bench("Storage.insert_data (unique check)",
+          lambda: storage.insert_data("assignments", {"title": f"new{next(counter)}", "due_date": "2030-01-01", "status": "pending"},
+                                      unique_columns=["title", "due_date"]), number=200)
+    bench("Storage.fetch_rows_by_date_range (7 days)",
+          lambda: storage.fetch_rows_by_date_range("assignments", "due_date", today, today + timedelta(days=7), status="pending"),
+          number=200)
+    bench("Storage.update_data",
+          lambda: storage.update_data("assignments", {"status": "pending"}, "title = ?", ("task1",)), number=200)
+    bench("Storage.upsert_many (1000 rows)",
+          lambda: storage.upsert_many("assignments", rows[:1000], conflict_columns=["title", "due_date"], update_columns=["status"]),
+          number=5)
+    storage.close()
+
+def bench_timetable(workdir):
+    from storage import Storage
+    from agents.timetable_agent import TimetableAgent
+
+    storage = Storage(os.path.join(workdir, "timetable.db"))
+    agent = TimetableAgent(os.path.join(workdir, "lukkari.csv"), storage=storage, poll_interval=None)
+    bench("TimetableAgent.get_next_class", agent.get_next_class, number=10000)
+    bench("TimetableAgent.get_next_class(course=...)", lambda: agent.get_next_class(course="Kurssi 3"), number=10000)
+    bench("TimetableAgent.get_classes_today", agent.get_classes_today, number=10000)
+    bench("TimetableAgent.get_week_schedule", agent.get_week_schedule, number=2000)
+
+    started = time.perf_counter()
+    TimetableAgent(os.path.join(workdir, "lukkari.csv"), storage=storage, poll_interval=None)
+    print(f"{'TimetableAgent cold start (snapshot)':<45}{(time.perf_counter() - started) * 1e3:>10.1f} ms")
+
+def bench_rag(workdir):
+    from ollama_rag import OllamaRAG
+
+    rag = OllamaRAG(persist_directory=os.path.join(workdir, "chroma_db"))
+    started = time.perf_counter()
+    rag.setup_vectorstore([os.environ["SIHTEERI_MENU_URL"]])
+    print(f"{'OllamaRAG.setup_vectorstore':<45}{(time.perf_counter() - started) * 1e3:>10.1f} ms")
+    bench("OllamaRAG.query (fake Ollama)", lambda: rag.query("What is for lunch today?"), number=10, repeat=3)
+
+def main():
+    selected = set(sys.argv[1:]) or {"storage", "timetable", "rag"}
+    fake_server, fake_url = start_fake_servers(openai_latency=0.0, ollama_latency=0.05, embedding_latency=0.0)
+    os.environ.update(fake_environment(fake_url))
+
+    with tempfile.TemporaryDirectory(prefix="sihteeri-bench-") as workdir:
+        create_course_data(workdir, lessons=8000)
+        os.chdir(workdir)
+        for name, fn in (("storage", bench_storage), ("timetable", bench_timetable), ("rag", bench_rag)):
+            if name in selected:
+                try:
+                    fn(workdir)
+                except ImportError as e:
+                    print(f"Skipping {name}: {e}")
+        os.chdir(ROOT)
+    fake_server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# benchmarks/router_eval.py
+"""
+Evaluates the local intent router on a labeled prompt set: for each threshold, the share of
+prompts routed without ChatGPT, the accuracy of those local decisions and the expected latency
+saved per prompt. Labels list the expected agents in order; [] marks prompts that should be
+left to ChatGPT. Prompts that are also router examples are excluded, so the figures are out of sample.
+
+Usage:
+    python benchmarks/router_eval.py [--prompts benchmarks/router_prompts.jsonl] [--interpret-latency 0.8] [--verbose]
+"""
+import os
+import sys
+import json
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from intent_router import IntentRouter, ROUTES, THRESHOLD
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_prompts.jsonl"))
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9,1.0")
+    parser.add_argument("--interpret-latency", type=float, default=0.8, help="mean interpret_prompt latency in seconds")
+    parser.add_argument("--verbose", action="store_true", help="print the decision path of every prompt at the default threshold")
+    args = parser.parse_args()
+
+    with open(args.prompts, encoding="utf-8") as f:
+        labeled = [json.loads(line) for line in f if line.strip()]
+    examples = {example.lower() for route in ROUTES.values() for example in route["examples"]}
+    in_sample = [item for item in labeled if item["prompt"].lower() in examples]
+    if in_sample:
+        print(f"Excluding {len(in_sample)} prompts that are router examples")
+        labeled = [item for item in labeled if item not in in_sample]
+
+    print(f"{'threshold':>10}{'local %':>9}{'accuracy':>10}{'misrouted':>11}{'fallbacks':>11}{'route µs':>10}{'saved ms':>10}")
+    for threshold in (float(value) for value in args.thresholds.split(",")):
+        result = IntentRouter(threshold=threshold).evaluate(labeled)
+        saved = result["local_rate"] * args.interpret_latency * 1000 - result["mean_route_us"] / 1000
+        marker = " *" if threshold == THRESHOLD else ""
+        print(f"{threshold:>10.2f}{result['local_rate'] * 100:>9.1f}{result['local_accuracy'] * 100:>10.1f}"
+              f"{result['misrouted']:>11}{result['fallbacks']:>11}{result['mean_route_us']:>10.0f}{saved:>10.0f}{marker}")
+
+    if args.verbose:
+        router = IntentRouter()
+        print()
+        for item in labeled:
+            decision = router.route(item["prompt"])
+            agents = [task["agent"] for task in decision.task_list["tasks"]] if decision.task_list else None
+            verdict = "-" if agents is None else ("ok" if agents == item["agents"] else "WRONG")
+            print(f"{item['prompt'][:50]:<52}{decision.path:<26}{verdict:<7}{decision.scores}")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,17 @@
-import os
-from openai import OpenAI
+from llm_client import chat_completion, get_client
 
 """ ChatGPT API is only allowed to work as user prompt interpreter as we emphasize data privacy """
 
-api_key = os.environ.get("OPENAI_API_KEY")
-if api_key is None:
-    raise ValueError("API key not found. Please set the OPENAI_API_KEY environment variable.")
+# Fail at import if OPENAI_API_KEY is not set
+get_client()
 
-client = OpenAI(api_key=api_key)
-
-def interpret_prompt(prompt, system_prompt):
-    chat_completion = client.chat.completions.create(
+def interpret_prompt(prompt, system_prompt, model="gpt-3.5-turbo", deadline=30.0):
+    chatgpt_reply = chat_completion(
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": prompt},
         ],
-        model="gpt-3.5-turbo",
+        model=model,
+        deadline=deadline,
     )
-    chatgpt_reply = chat_completion.choices[0].message.content
     return chatgpt_reply
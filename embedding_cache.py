@@ -0,0 +1,169 @@
+# embedding_cache.py
+import time
+import math
+import hashlib
+import threading
+from array import array
+from typing import List, Optional, Dict, Any
+
+from langchain_core.embeddings import Embeddings
+
+from storage import Storage
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a disk-backed cache keyed by (model, text hash).
+    Vectors are stored as float32 blobs in SQLite, evicted in LRU order when the cache
+    grows over max_bytes, and cache misses are embedded with a single batched call.
+    """
+
+    table = "embedding_cache"
+
+    def __init__(self, embeddings: Embeddings, model_name: str, storage: Optional[Storage] = None, max_bytes: int = 256 * 1024 * 1024,
+                 flush_interval: float = 60.0):
+        """
+        Initializes the cache.
+
+        Parameters:
+            embeddings (Embeddings): The embedding model to wrap.
+            model_name (str): Name of the model, part of the cache key.
+            storage (Storage): Storage holding the cache table.
+            max_bytes (int): Maximum total size of the cached vectors.
+            flush_interval (float): Seconds between writes of the hit timestamps. Hits are
+                recorded in memory, so that lookups do not take the database write lock.
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.storage = storage or Storage()
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self.flush_interval = flush_interval
+        self.last_used = {}  # key -> time of its latest hit, not yet written
+        self.flushed_at = time.monotonic()
+        self._initialize_table()
+
+    def _initialize_table(self):
+        schema = {
+            "table": self.table,
+            "fields": {
+                "key": "TEXT PRIMARY KEY",
+                "model": "TEXT NOT NULL",
+                "vector": "BLOB NOT NULL",
+                "size": "INTEGER NOT NULL",
+                "last_used": "REAL NOT NULL"
+            }
+        }
+        self.storage.create_table(schema)
+
+    def _key(self, kind: str, text: str) -> str:
+        # Query and document embeddings may use different instructions, so they are cached separately
+        return hashlib.sha256(f"{self.model_name}\n{kind}\n{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay below SQLite's limit of host parameters per statement
+        for i in range(0, len(unique_keys), 500):
+            batch = unique_keys[i:i + 500]
+            placeholders = ', '.join(['?'] * len(batch))
+            rows = self.storage.execute_query(
+                f"SELECT key, vector FROM {self.table} WHERE key IN ({placeholders})", tuple(batch)
+            )
+            for key, blob in rows:
+                vector = array('f')
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+
+        if found:
+            now = time.time()
+            with self.lock:
+                self.last_used.update(dict.fromkeys(found, now))
+                due = time.monotonic() - self.flushed_at >= self.flush_interval
+            if due:
+                self._flush_last_used()
+        return found
+
+    def _flush_last_used(self):
+        """
+        Writes the recorded hit timestamps in one transaction.
+        """
+        with self.lock:
+            last_used, self.last_used = self.last_used, {}
+            self.flushed_at = time.monotonic()
+        if last_used:
+            with self.storage.transaction() as conn:
+                conn.executemany(f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                                 [(used, key) for key, used in last_used.items()])
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        for key, vector in vectors.items():
+            blob = array('f', vector).tobytes()
+            rows.append({"key": key, "model": self.model_name, "vector": blob, "size": len(blob), "last_used": now})
+        self.storage.upsert_many(self.table, rows, conflict_columns=["key"], update_columns=["vector", "size", "last_used"])
+        # Eviction orders by last_used, so the recent hits are written first
+        self._flush_last_used()
+        self._evict()
+
+    def _evict(self):
+        """
+        Deletes the least recently used vectors while the cache is over max_bytes.
+        """
+        total, count = self.storage.execute_query(f"SELECT COALESCE(SUM(size), 0), COUNT(*) FROM {self.table}")[0]
+        if total <= self.max_bytes or not count:
+            return
+        excess_rows = math.ceil((total - self.max_bytes) / (total / count))
+        self.storage.execute_query(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY last_used LIMIT ?)",
+            (excess_rows,)
+        )
+
+    def _embed(self, kind: str, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        found = self._lookup(keys)
+
+        # Embed all distinct misses with one bulk request
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            started = time.perf_counter()
+            if kind == "query":
+                vectors = [self.embeddings.embed_query(text) for text in missing.values()]
+            else:
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            elapsed = time.perf_counter() - started
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        else:
+            elapsed = 0.0
+
+        with self.lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            self.miss_seconds += elapsed
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit rate and an estimate of the embedding time saved by the cache,
+        based on the average time spent per missed text.
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            seconds_per_miss = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "seconds_saved": self.hits * seconds_per_miss
+            }
@@ -0,0 +1,164 @@
+# file_sync.py
+import os
+import sys
+import time
+import threading
+from typing import Callable, Dict, List, Set, Tuple
+
+from storage import Storage
+
+class DirectoryWatcher:
+    """
+    Tracks the files of a directory in SQLite and reports what has changed since the
+    previous scan. The directory mtime is checked first, so an unchanged directory
+    costs a single stat call.
+    """
+
+    def __init__(self, path: str, storage: Storage):
+        """
+        Initializes the watcher and loads the file state recorded by earlier runs.
+
+        Parameters:
+            path (str): The directory to watch.
+            storage (Storage): Storage holding the recorded file state.
+        """
+        self.path = path
+        self.storage = storage
+        self._initialize_tables()
+        self.load_state()
+
+    def load_state(self):
+        """
+        Loads the recorded file state, e.g. again after the transaction of a scan was rolled back.
+        """
+        rows = self.storage.execute_query("SELECT mtime FROM directory_state WHERE path = ?", (self.path,))
+        self.dir_mtime = rows[0][0] if rows else None
+        self.files: Dict[str, Tuple[int, int]] = {
+            name: (size, mtime)
+            for name, size, mtime in self.storage.execute_query(
+                "SELECT name, size, mtime FROM file_state WHERE path = ?", (self.path,)
+            )
+        }
+
+    def _initialize_tables(self):
+        self.storage.create_table({
+            "table": "directory_state",
+            "fields": {
+                "path": "TEXT PRIMARY KEY",
+                "mtime": "INTEGER NOT NULL"
+            }
+        })
+        self.storage.create_table({
+            "table": "file_state",
+            "fields": {
+                "path": "TEXT NOT NULL",
+                "name": "TEXT NOT NULL",
+                "size": "INTEGER NOT NULL",
+                "mtime": "INTEGER NOT NULL"
+            },
+            "constraints": ["PRIMARY KEY(path, name)"]
+        })
+
+    def is_stale(self) -> bool:
+        """
+        Returns True if the directory has changed since the last scan.
+        """
+        return os.stat(self.path).st_mtime_ns != self.dir_mtime
+
+    def scan(self, force: bool = False) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compares the directory with the recorded state and records the new state. Run it in one
+        transaction with the processing of the changes, and call load_state() if that fails, so
+        that the changes are reported again instead of being lost.
+
+        Parameters:
+            force (bool): Stat every file even if the directory mtime is unchanged. Needed
+                to notice files modified in place.
+
+        Returns:
+            tuple: Lists of added, modified and removed file names.
+        """
+        dir_mtime = os.stat(self.path).st_mtime_ns
+        if not force and dir_mtime == self.dir_mtime:
+            return [], [], []
+
+        current = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+        added = [name for name in current if name not in self.files]
+        modified = [name for name in current if name in self.files and current[name] != self.files[name]]
+        removed = [name for name in self.files if name not in current]
+
+        with self.storage.transaction():
+            self.storage.upsert_many(
+                "file_state",
+                [{"path": self.path, "name": name, "size": current[name][0], "mtime": current[name][1]}
+                 for name in added + modified],
+                conflict_columns=["path", "name"], update_columns=["size", "mtime"]
+            )
+            for name in removed:
+                self.storage.execute_query("DELETE FROM file_state WHERE path = ? AND name = ?", (self.path, name))
+            self.storage.upsert_many(
+                "directory_state", [{"path": self.path, "mtime": dir_mtime}],
+                conflict_columns=["path"], update_columns=["mtime"]
+            )
+
+        self.files = current
+        self.dir_mtime = dir_mtime
+        return added, modified, removed
+
+    def names(self) -> Set[str]:
+        """
+        Returns the names of the files seen in the last scan.
+        """
+        return set(self.files)
+
+def watch(paths: List[str], callback: Callable[[bool], None], interval: float = 5.0, full_scan_every: int = 12) -> threading.Thread:
+    """
+    Starts a background thread that calls callback whenever the directories may have changed.
+    Uses inotify when the optional inotify_simple package is available on Linux, and
+    falls back to polling every interval seconds otherwise.
+
+    Parameters:
+        paths (list): Directories to watch.
+        callback (callable): Called with force=True when files may have been modified in
+            place, and with force=False for a cheap directory mtime check.
+        interval (float): Polling interval in seconds.
+        full_scan_every (int): When polling, force a full scan every this many intervals.
+
+    Returns:
+        threading.Thread: The watcher thread.
+    """
+    inotify = None
+    if sys.platform.startswith("linux"):
+        try:
+            from inotify_simple import INotify, flags
+            inotify = INotify()
+            mask = flags.CREATE | flags.DELETE | flags.CLOSE_WRITE | flags.MOVED_FROM | flags.MOVED_TO
+            for path in paths:
+                inotify.add_watch(path, mask)
+        except ImportError:
+            inotify = None
+
+    def run():
+        ticks = 0
+        while True:
+            if inotify:
+                events = inotify.read(timeout=int(interval * 1000))
+                force = bool(events)
+            else:
+                time.sleep(interval)
+                ticks += 1
+                force = ticks % full_scan_every == 0
+            try:
+                callback(force)
+            except Exception as e:
+                print(f"Directory sync failed: {e}")
+
+    thread = threading.Thread(target=run, name="file-sync", daemon=True)
+    thread.start()
+    return thread
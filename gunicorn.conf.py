@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+"""
+Production launch (Linux/macOS):
+
+    gunicorn -c gunicorn.conf.py backend:app
+
+The app and its Manager are loaded once in the master process, before the HTTP workers are
+forked, so agent state (parsed timetable, vector store, router embeddings) is shared
+copy-on-write instead of being rebuilt in every worker. Process-hosted agents
+(SIHTEERI_AGENT_PROCESSES) are started in each worker after the fork, so each worker has its own
+pool of them. The background tasks of the agents run in one worker only (see Manager.after_fork).
+Metrics at /metrics are per worker.
+"""
+import os
+
+os.environ.setdefault("SIHTEERI_PRELOAD", "1")
+
+bind = os.environ.get("SIHTEERI_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("SIHTEERI_HTTP_WORKERS", "4"))
+worker_class = "gthread"
+threads = int(os.environ.get("SIHTEERI_HTTP_THREADS", "8"))
+preload_app = True
+timeout = 120  # menu generation on CPU can take a minute
+graceful_timeout = 30
+
+def post_fork(server, worker):
+    import backend
+    backend.after_fork()
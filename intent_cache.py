@@ -0,0 +1,147 @@
+# intent_cache.py
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from storage import Storage
+
+class IntentCache:
+    """
+    Caches task lists produced by interpret_prompt, keyed by the normalized user prompt
+    and a hash of the system prompt. Entries are evicted in LRU order and expire after a TTL.
+    """
+
+    table = "intent_cache"
+
+    def __init__(self, max_entries: int = 512, ttl: float = 24 * 3600, storage: Optional[Storage] = None):
+        """
+        Initializes the cache.
+
+        Parameters:
+            max_entries (int): Maximum number of task lists kept in memory.
+            ttl (float): Time to live of an entry in seconds.
+            storage (Storage): Optional storage for persisting entries over restarts.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.storage = storage
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.storage:
+            self._initialize_table()
+
+    def _initialize_table(self):
+        schema = {
+            "table": self.table,
+            "fields": {
+                "key": "TEXT PRIMARY KEY",
+                "system_hash": "TEXT NOT NULL",
+                "task_list": "TEXT NOT NULL",
+                "created_at": "REAL NOT NULL"
+            }
+        }
+        self.storage.create_table(schema)
+        self.storage.execute_query(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl,))
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        """
+        Normalizes a prompt so that trivially different spellings share a cache entry.
+        """
+        prompt = re.sub(r"\s+", " ", prompt.strip().lower())
+        return prompt.rstrip("?!. ")
+
+    @staticmethod
+    def hash_system_prompt(system_prompt: str) -> str:
+        return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+    def _key(self, prompt: str, system_hash: str) -> str:
+        return hashlib.sha256(f"{system_hash}\n{self.normalize(prompt)}".encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, system_prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached task list for the prompt, or None on a miss.
+        """
+        key = self._key(prompt, self.hash_system_prompt(system_prompt))
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.entries.pop(key, None)
+
+        if self.storage:
+            rows = self.storage.execute_query(
+                f"SELECT task_list, created_at FROM {self.table} WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl)
+            )
+            if rows:
+                task_list = json.loads(rows[0][0])
+                with self.lock:
+                    self._remember(key, task_list, rows[0][1])
+                    self.hits += 1
+                return task_list
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, prompt: str, system_prompt: str, task_list: Dict[str, Any]):
+        """
+        Stores a task list for the prompt.
+        """
+        system_hash = self.hash_system_prompt(system_prompt)
+        key = self._key(prompt, system_hash)
+        created_at = time.time()
+        with self.lock:
+            self._remember(key, task_list, created_at)
+
+        if self.storage:
+            self.storage.execute_query(
+                f"INSERT OR REPLACE INTO {self.table} (key, system_hash, task_list, created_at) VALUES (?, ?, ?, ?)",
+                (key, system_hash, json.dumps(task_list, ensure_ascii=False), created_at)
+            )
+
+    def _remember(self, key: str, task_list: Dict[str, Any], created_at: float):
+        self.entries[key] = (task_list, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, system_prompt: Optional[str] = None):
+        """
+        Drops all cached entries. When system_prompt is given, persisted entries created
+        for that system prompt are kept.
+        """
+        with self.lock:
+            self.entries.clear()
+
+        if self.storage:
+            if system_prompt is None:
+                self.storage.execute_query(f"DELETE FROM {self.table}")
+            else:
+                self.storage.execute_query(
+                    f"DELETE FROM {self.table} WHERE system_hash != ?",
+                    (self.hash_system_prompt(system_prompt),)
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns hit/miss counters and the current number of entries in memory.
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries)
+            }
@@ -0,0 +1,216 @@
+# intent_router.py
+import re
+import time
+import hashlib
+from collections import namedtuple
+from typing import Dict, List, Optional, Iterable
+
+import numpy as np
+
+""" Local first-stage router: scores the prompt against per-agent keyword stems and example utterances
+(cosine similarity of hashed character n-gram embeddings, one matrix product per prompt) and builds the
+task list directly when it is confident. Ambiguous prompts are left to interpret_prompt. """
+
+# Per-agent keyword stems (matched as word prefixes), example utterances and the instructions for the task
+ROUTES = {
+    "timetable_agent": {
+        "keywords": {"luento", "luenno", "luennol", "tunti", "tunni", "lukkari", "lukujärjestys", "luokka", "luokas",
+                     "sali", "opetus", "oppitun", "lecture", "class", "schedule", "timetable", "room"},
+        "examples": ["Milloin on seuraava luento?", "seuraava luento", "Missä luokassa on seuraava luento?",
+                     "Mitä tunteja minulla on tänään?", "Näytä viikon lukujärjestys", "Missä salissa kurssi on?",
+                     "When is my next class?", "What is my schedule this week?"],
+        "instructions": "Return the next class"
+    },
+    "menu_agent": {
+        "keywords": {"ruoka", "ruoa", "ruua", "ruuaks", "ruokala", "lounas", "lounaa", "syö", "syödä", "päivällinen",
+                     "menu", "lunch", "food", "eat"},
+        "examples": ["Mitä ruokana tänään?", "Mikä on päivän lounas?", "Mitä ruokalassa on tänään?",
+                     "Mitä tänään syödään?", "What is for lunch today?", "Show today's menu"],
+        "instructions": "Return today's lunch menu"
+    },
+    "assignments_agent": {
+        "keywords": {"tehtäv", "kotitehtäv", "harjoitu", "palautu", "palauta", "palautet", "deadline", "määräai",
+                     "assignment", "homework", "due"},
+        "examples": ["Mitkä tehtävät ovat tulossa?", "Onko minulla tehtäviä tällä viikolla?",
+                     "Olenko palauttanut kotitehtäväni?", "Milloin seuraavan tehtävän määräaika on?",
+                     "Which assignments are due soon?", "Do I have homework?"],
+        "instructions": "List upcoming assignments"
+    },
+    "haiku_agent": {
+        "keywords": {"haiku", "runo", "runoi", "poem", "poetry"},
+        "examples": ["Kirjoita haiku", "Kirjoita minulle runo", "Kirjoita minulle runo (haiku)",
+                     "Write me a haiku", "Write a poem"],
+        "instructions": "Write a haiku"
+    },
+}
+
+DIMENSIONS = 4096
+NGRAM_SIZES = (3, 4)
+KEYWORD_BONUS = 0.3  # added to the similarity when the prompt contains a keyword of the agent
+THRESHOLD = 0.6  # minimum score for routing locally; see benchmarks/router_eval.py
+MIN_SIMILARITY = 0.4  # minimum similarity to the agent's examples, keywords or not
+MARGIN = 0.15  # minimum lead of the best agent over the runner-up
+
+# Boundaries between the parts of a multi-part prompt
+CLAUSE_PATTERN = re.compile(r"[?!.;]+|\b(?:ja|sekä|and)\b", re.IGNORECASE)
+
+RouteDecision = namedtuple("RouteDecision", ["task_list", "path", "scores", "elapsed"])
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+def embed(texts: Iterable[str]) -> np.ndarray:
+    """
+    Embeds texts as L2-normalized hashed character n-gram counts, one row per text. Character
+    n-grams match inflected Finnish word forms (luento, luennot, luentoa) without a model.
+    """
+    texts = list(texts)
+    matrix = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            padded = f"<{token}>"
+            for n in NGRAM_SIZES:
+                for i in range(max(1, len(padded) - n + 1)):
+                    digest = hashlib.blake2b(padded[i:i + n].encode("utf-8"), digest_size=8).digest()
+                    matrix[row, int.from_bytes(digest, "little") % DIMENSIONS] += 1.0
+    np.sqrt(matrix, out=matrix)  # Damp repeated n-grams
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class IntentRouter:
+    """
+    Routes prompts that clearly belong to one or more agents without calling ChatGPT.
+    """
+
+    def __init__(self, agents: Optional[Dict[str, str]] = None, routes: Dict[str, dict] = ROUTES,
+                 threshold: float = THRESHOLD, margin: float = MARGIN, min_similarity: float = MIN_SIMILARITY):
+        """
+        Initializes the router and precomputes the example embeddings.
+
+        Parameters:
+            agents (dict): Agent name -> description of the available agents, e.g. from Manager.
+                The description is used as one more example. Defaults to all agents in routes.
+            routes (dict): Keyword stems, examples and instructions per agent.
+            threshold (float): Minimum score (similarity + keyword bonus) for routing locally.
+            margin (float): Minimum lead of the best single agent over the runner-up.
+            min_similarity (float): Minimum similarity of an agent to its examples, so that a
+                keyword alone never routes a prompt.
+        """
+        if agents is None:
+            agents = {name: "" for name in routes}
+        self.routes = {name: route for name, route in routes.items() if name in agents}
+        self.names = list(self.routes)
+        self.threshold = threshold
+        self.margin = margin
+        self.min_similarity = min_similarity
+
+        examples, owners = [], []
+        for i, name in enumerate(self.names):
+            for example in self.routes[name]["examples"] + ([agents[name]] if agents[name] else []):
+                examples.append(example)
+                owners.append(i)
+        self.example_matrix = embed(examples)
+        self.example_owner = np.array(owners)
+
+    def _score(self, text: str):
+        """
+        Returns the score of each agent (the best cosine similarity to its examples plus
+        KEYWORD_BONUS if the text contains one of its keywords), the similarity alone and the
+        index of the first token matching a keyword of each agent (-1 if none).
+        """
+        similarities = self.example_matrix @ embed([text])[0]
+        best = np.full(len(self.names), -1.0, dtype=np.float32)
+        np.maximum.at(best, self.example_owner, similarities)
+
+        tokens = tokenize(text)
+        positions = np.full(len(self.names), -1)
+        for i, name in enumerate(self.names):
+            keywords = self.routes[name]["keywords"]
+            for position, token in enumerate(tokens):
+                if any(token.startswith(keyword) for keyword in keywords):
+                    positions[i] = position
+                    break
+        return best + KEYWORD_BONUS * (positions >= 0), best, positions
+
+    def _route_clause(self, clause: str):
+        """
+        Returns the agent indices for one clause in the order asked, or None if it is not clear,
+        together with the decision path and the scores.
+        """
+        scores, similarities, positions = self._score(clause)
+        order = np.argsort(-scores)
+        # Every candidate, also each agent of a multi-agent clause, must resemble its examples
+        candidates = [i for i in order if scores[i] >= self.threshold and similarities[i] >= self.min_similarity]
+
+        if not candidates:
+            return None, "fallback:low_confidence", scores
+        if len(candidates) == 1:
+            runner_up = scores[order[1]] if len(order) > 1 else -1.0
+            if scores[candidates[0]] - runner_up >= self.margin:
+                return candidates, "local:single", scores
+            return None, "fallback:ambiguous", scores
+        if all(positions[i] >= 0 for i in candidates):
+            # Several agents with their own keywords: answered in the order asked
+            return sorted(candidates, key=lambda i: positions[i]), "local:multi", scores
+        return None, "fallback:ambiguous", scores
+
+    def route(self, prompt: str) -> RouteDecision:
+        """
+        Decides the task list for a prompt. A prompt of several clauses ("...? ...", "... ja ...")
+        is routed clause by clause and falls back as a whole if any clause is unclear.
+
+        Returns:
+            RouteDecision: task_list is None when the prompt should go to interpret_prompt;
+            path tells how the decision was made, scores holds the best score of each agent.
+        """
+        started = time.perf_counter()
+        clauses = [clause for clause in CLAUSE_PATTERN.split(prompt) if tokenize(clause)] or [prompt]
+        decisions = [self._route_clause(clause) for clause in clauses]
+        scores = np.max([decision[2] for decision in decisions], axis=0)
+
+        agents = []
+        for clause_agents, path, _ in decisions:
+            if clause_agents is None:
+                agents = None
+                break
+            agents.extend(i for i in clause_agents if i not in agents)
+        if len(decisions) > 1:
+            if agents is None:
+                path = "fallback:unclear_clause"
+            else:
+                path = "local:multi" if len(agents) > 1 else "local:single"
+
+        task_list = None
+        if agents is not None:
+            task_list = {"tasks": [{"agent": self.names[i], "instructions": self.routes[self.names[i]]["instructions"]}
+                                   for i in agents]}
+        return RouteDecision(task_list, path, {name: round(float(score), 3) for name, score in zip(self.names, scores)},
+                             time.perf_counter() - started)
+
+    def evaluate(self, labeled: List[dict]) -> Dict[str, float]:
+        """
+        Measures the router on labeled prompts ({"prompt": ..., "agents": [...]}), counting
+        prompts left to interpret_prompt separately from local decisions.
+
+        Returns:
+            dict: local_rate (share routed locally), local_accuracy (share of local decisions
+            with exactly the labeled agents), misrouted (count), fallbacks (count) and the
+            mean routing time in microseconds.
+        """
+        local = correct = 0
+        elapsed = 0.0
+        for item in labeled:
+            decision = self.route(item["prompt"])
+            elapsed += decision.elapsed
+            if decision.task_list is not None:
+                local += 1
+                correct += [task["agent"] for task in decision.task_list["tasks"]] == item["agents"]
+        total = len(labeled)
+        return {
+            "prompts": total,
+            "local_rate": local / total if total else 0.0,
+            "local_accuracy": correct / local if local else 1.0,
+            "misrouted": local - correct,
+            "fallbacks": total - local,
+            "mean_route_us": elapsed / total * 1e6 if total else 0.0
+        }
@@ -0,0 +1,197 @@
+# llm_client.py
+import os
+import time
+import random
+import asyncio
+import threading
+
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
+
+""" Shared OpenAI client: one pooled HTTP connection pool per process (sync and asyncio), per-call
+deadlines, jittered exponential backoff on 429/5xx and a circuit breaker that fails fast when the
+API is down. """
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+DEFAULT_DEADLINE = 30.0  # seconds per call, including retries
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 8.0  # seconds
+
+# Connection pool: warm TLS connections are reused by concurrent callers
+POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60.0)
+CONNECT_TIMEOUT = 5.0
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling the API while the circuit breaker is open.
+    """
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failed calls (retryable errors that persisted
+    through all retries) and rejects calls for reset_timeout
+    seconds. After that a single trial call is let through (half-open); its success closes
+    the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_running:
+                raise CircuitOpenError("OpenAI API is unavailable, failing fast.")
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release(self):
+        """
+        Ends a call whose error says nothing about the API being down, e.g. a rejected request.
+        """
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker()
+
+_client = None
+_async_clients = {}
+_client_lock = threading.Lock()
+
+def _api_key():
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if api_key is None:
+        raise ValueError("API key not found. Please set the OPENAI_API_KEY environment variable.")
+    return api_key
+
+def get_client():
+    """
+    Returns the shared OpenAI client. Retries are handled here, not by the SDK.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            http_client = httpx.Client(limits=POOL_LIMITS, timeout=httpx.Timeout(DEFAULT_DEADLINE, connect=CONNECT_TIMEOUT))
+            _client = OpenAI(api_key=_api_key(), http_client=http_client, max_retries=0)
+        return _client
+
+def get_async_client():
+    """
+    Returns the shared AsyncOpenAI client of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            http_client = httpx.AsyncClient(limits=POOL_LIMITS, timeout=httpx.Timeout(DEFAULT_DEADLINE, connect=CONNECT_TIMEOUT))
+            client = _async_clients[loop] = AsyncOpenAI(api_key=_api_key(), http_client=http_client, max_retries=0)
+        return client
+
+def _is_retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _backoff(attempt, remaining):
+    """
+    Full-jitter exponential backoff, capped by the time left before the deadline.
+    """
+    return min(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)), max(0.0, remaining))
+
+def _request(messages, model, extra):
+    return dict(messages=messages, model=model, **extra)
+
+def chat_completion(messages, model=DEFAULT_MODEL, deadline=DEFAULT_DEADLINE, **extra):
+    """
+    Calls the chat completions API and returns the reply text.
+
+    Parameters:
+        messages (list): The chat messages.
+        model (str): The model to use.
+        deadline (float): Seconds the call may take in total, including retries.
+        extra: Further arguments for chat.completions.create, e.g. n or temperature.
+
+    Returns:
+        str: The content of the first choice.
+    """
+    return chat_completion_choices(messages, model, deadline, **extra)[0]
+
+def chat_completion_choices(messages, model=DEFAULT_MODEL, deadline=DEFAULT_DEADLINE, **extra):
+    """
+    Like chat_completion, but returns the content of every choice.
+    """
+    client = get_client()
+    end = time.monotonic() + deadline
+    breaker.before_call()
+    for attempt in range(MAX_RETRIES + 1):
+        remaining = end - time.monotonic()
+        try:
+            completion = client.with_options(timeout=max(remaining, 0.1)).chat.completions.create(**_request(messages, model, extra))
+        except Exception as e:
+            if not _is_retryable(e):
+                breaker.release()
+                raise
+            remaining = end - time.monotonic()
+            if attempt == MAX_RETRIES or remaining <= 0:
+                # One failure per call, counted only once its retries are exhausted
+                breaker.record_failure()
+                raise
+            time.sleep(_backoff(attempt, remaining))
+            continue
+        breaker.record_success()
+        return [choice.message.content for choice in completion.choices]
+
+async def achat_completion(messages, model=DEFAULT_MODEL, deadline=DEFAULT_DEADLINE, **extra):
+    """
+    asyncio version of chat_completion for concurrent callers.
+    """
+    return (await achat_completion_choices(messages, model, deadline, **extra))[0]
+
+async def achat_completion_choices(messages, model=DEFAULT_MODEL, deadline=DEFAULT_DEADLINE, **extra):
+    """
+    asyncio version of chat_completion_choices.
+    """
+    client = get_async_client()
+    loop = asyncio.get_running_loop()
+    end = loop.time() + deadline
+    breaker.before_call()
+    for attempt in range(MAX_RETRIES + 1):
+        remaining = end - loop.time()
+        try:
+            completion = await client.with_options(timeout=max(remaining, 0.1)).chat.completions.create(**_request(messages, model, extra))
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            if not _is_retryable(e):
+                breaker.release()
+                raise
+            remaining = end - loop.time()
+            if attempt == MAX_RETRIES or remaining <= 0:
+                # One failure per call, counted only once its retries are exhausted
+                breaker.record_failure()
+                raise
+            await asyncio.sleep(_backoff(attempt, remaining))
+            continue
+        breaker.record_success()
+        return [choice.message.content for choice in completion.choices]
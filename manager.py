@@ -1,51 +1,259 @@
 import os
+import ast
+import time
+import hashlib
 import importlib
 import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import instrument, log
+from agent_process import ProcessAgent
+
+# Lock file electing the one forked HTTP worker that runs the agents' background tasks
+BACKGROUND_LOCK_PATH = os.environ.get("SIHTEERI_BACKGROUND_LOCK", "sihteeri-background.lock")
+BACKGROUND_LOCK_RETRY = 30  # seconds between attempts of the other workers to take over
+
+# A failed agent is loaded again on use after a backoff, doubling per failure up to the maximum
+LOAD_RETRY_BASE = 5  # seconds
+LOAD_RETRY_MAX = 300  # seconds
 
 class Manager:
-    def __init__(self):
-        # Dictionary to hold dynamically loaded agents by filename
+    def __init__(self, process_agents=None, preload=False):
+        """
+        Initializes the Manager.
+
+        Parameters:
+            process_agents (dict): Agents hosted in worker processes instead of in this process,
+                agent name -> ProcessAgent options, e.g. {"menu_agent": {"workers": 2, "timeout": 60}}.
+            preload (bool): The Manager is loaded in a parent process that forks HTTP workers.
+                Agents are then created without their background tasks, and after_fork() starts
+                the process-hosted agents in each worker and the background tasks in one of them.
+        """
+        self.process_agents = process_agents or {}
+        self.preload = preload
+        # Whether agents run their background tasks (schedulers, folder watchers) in this process
+        self.background = not preload
+        self.background_lock = None
+
+        # Dictionary to hold dynamically discovered agents by filename
         self.agents = {}
-        
-        # Dynamically load agents from the agents folder
+
+        # Dynamically discover agents from the agents folder
         self.load_agents()
 
     def load_agents(self):
         """
-        Dynamically loads all agents in the agents folder using the filename as the key,
-        and populates the agents dictionary with the agent instances and their descriptions.
+        Discovers all agents in the agents folder using the filename as the key, and
+        populates the agents dictionary with their descriptions. The registry is built from
+        the class metadata in the source files alone: modules are imported and agents
+        instantiated lazily on first use (or by warm_up).
         """
         agents_path = os.path.join(os.path.dirname(__file__), 'agents')
-        for filename in os.listdir(agents_path):
+        agents = {}
+        for filename in sorted(os.listdir(agents_path)):
             # Process only Python files, ignore __init__.py
             if filename.endswith('.py') and filename != '__init__.py':
                 agent_name = filename[:-3]  # Remove the '.py' extension
-                module_name = f'agents.{agent_name}'
-                module = importlib.import_module(module_name)
-
-                # Find the first class in the module to use as the agent
-                for _, obj in inspect.getmembers(module, inspect.isclass):
-                    # Ensure the class is defined in the current module
-                    if obj.__module__ == module_name:
-                        # Instantiate the agent and retrieve its description
-                        agent_instance = obj()
-                        description = getattr(agent_instance, "description", "No description provided")
-                        
-                        # Store the agent instance and description with the filename as the key
-                        self.agents[agent_name] = {
-                            "instance": agent_instance,
-                            "description": description
-                        }
-                        break  # Stop after the first class is found
+                class_name, description = self._read_class_metadata(os.path.join(agents_path, filename))
+                if class_name is None:
+                    continue
+
+                agents[agent_name] = {
+                    "module": f'agents.{agent_name}',
+                    "class_name": class_name,
+                    "description": description,
+                    "instance": None,
+                    "error": None,
+                    "failures": 0,
+                    "retry_at": 0.0,
+                    "timings": {},
+                    "background": False,
+                    "lock": threading.Lock()
+                }
+        self.agents = agents
+
+    @staticmethod
+    def _read_class_metadata(path):
+        """
+        Returns the name and description of the first class defined in an agent source file,
+        without importing it.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=path)
+
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef):
+                description = "No description provided"
+                for statement in node.body:
+                    if (isinstance(statement, ast.Assign)
+                            and any(isinstance(target, ast.Name) and target.id == "description" for target in statement.targets)
+                            and isinstance(statement.value, ast.Constant)):
+                        description = statement.value.value
+                return node.name, description
+        return None, None
+
+    def _instantiate(self, name):
+        """
+        Imports and instantiates an agent, recording the import and init cost. A failing
+        agent is recorded as an error and does not affect the other agents; it is tried again
+        on use once its retry backoff has passed, since the failure may be transient (Ollama
+        or the menu server down, a worker process starting slowly).
+        """
+        data = self.agents[name]
+        with data["lock"]:
+            if data["instance"] is not None or (data["error"] is not None and time.monotonic() < data["retry_at"]):
+                return data["instance"]
+
+            try:
+                if name in self.process_agents:
+                    # The worker processes import and initialize the agent
+                    started = time.perf_counter()
+                    agent = ProcessAgent(name, data["module"], data["class_name"], **self.process_agents[name])
+                    if self.background:
+                        agent.start_background_tasks()
+                    data["background"] = self.background
+                else:
+                    started = time.perf_counter()
+                    module = importlib.import_module(data["module"])
+                    data["timings"]["import"] = time.perf_counter() - started
+
+                    agent_class = getattr(module, data["class_name"])
+                    if not inspect.isclass(agent_class):
+                        raise TypeError(f"{data['class_name']} is not a class")
+
+                    started = time.perf_counter()
+                    if "background" in inspect.signature(agent_class).parameters:
+                        agent = agent_class(background=self.background)
+                        data["background"] = self.background
+                    else:
+                        agent = agent_class()
+                # Every public agent method is traced as <agent name>.<method>
+                data["instance"] = instrument(agent, name)
+                data["timings"]["init"] = time.perf_counter() - started
+                data["error"] = None
+                data["failures"] = 0
+            except Exception as e:
+                data["error"] = f"{type(e).__name__}: {e}"
+                data["failures"] += 1
+                backoff = min(LOAD_RETRY_BASE * 2 ** (data["failures"] - 1), LOAD_RETRY_MAX)
+                data["retry_at"] = time.monotonic() + backoff
+                print(f"Failed to load agent {name} (retrying in {backoff} s): {data['error']}")
+            return data["instance"]
+
+    def warm_up(self, background=True, max_workers=4):
+        """
+        Instantiates all agents concurrently and prints the startup timing report. When preloading,
+        process-hosted agents are left for after_fork().
+
+        Parameters:
+            background (bool): Return immediately and warm up in a background thread.
+            max_workers (int): Number of agents initialized in parallel.
+        """
+        names = [name for name in self.agents if not (self.preload and name in self.process_agents)]
+
+        def run():
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warm-up") as executor:
+                list(executor.map(self._instantiate, names))
+            print(self.get_startup_report())
+
+        if background:
+            thread = threading.Thread(target=run, name="agent-warm-up", daemon=True)
+            thread.start()
+            return thread
+        run()
+
+    def after_fork(self):
+        """
+        Called in each forked HTTP worker of a preloaded Manager: warms up the process-hosted
+        agents and competes for the background lock. The worker holding it runs the background
+        tasks of all agents; if it exits, another worker takes over within BACKGROUND_LOCK_RETRY
+        seconds. The other workers' agents refresh their state from the shared database.
+        """
+        self.preload = False
+
+        def run():
+            self.warm_up(background=False)
+            while not self._acquire_background_lock():
+                time.sleep(BACKGROUND_LOCK_RETRY)
+            log("background_tasks_started", pid=os.getpid())
+            self.start_background_tasks()
+
+        threading.Thread(target=run, name="agent-after-fork", daemon=True).start()
+
+    def _acquire_background_lock(self):
+        import fcntl  # after_fork is only used with gunicorn, i.e. on Unix
+
+        lock_file = open(BACKGROUND_LOCK_PATH, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Held until the process exits
+        self.background_lock = lock_file
+        return True
+
+    def start_background_tasks(self):
+        """
+        Starts the background tasks of the loaded agents in this process; agents loaded later
+        start their own.
+        """
+        self.background = True
+        for data in self.agents.values():
+            with data["lock"]:
+                start_background_tasks = getattr(data["instance"], "start_background_tasks", None)
+                if start_background_tasks and not data["background"]:
+                    start_background_tasks()
+                    data["background"] = True
+
+    def shutdown(self):
+        """
+        Stops the worker processes of the process-hosted agents.
+        """
+        for data in self.agents.values():
+            if isinstance(data["instance"], ProcessAgent):
+                data["instance"].shutdown()
+
+    def get_startup_report(self):
+        """
+        Returns a report of the per-agent import and init cost.
+        """
+        lines = [f"{'Agent':<20}{'import':>10}{'init':>10}  status"]
+        for name, data in self.agents.items():
+            timings = data["timings"]
+            import_time = f"{timings['import']:.2f}s" if "import" in timings else "-"
+            init_time = f"{timings['init']:.2f}s" if "init" in timings else "-"
+            if data["error"]:
+                status = f"failed ({data['error']})"
+            elif isinstance(data["instance"], ProcessAgent):
+                status = f"ready ({self.process_agents[name].get('workers', 1)} processes)"
+            elif data["instance"] is not None:
+                status = "ready"
+            else:
+                status = "not loaded"
+            lines.append(f"{name:<20}{import_time:>10}{init_time:>10}  {status}")
+        return "\n".join(lines)
 
     def get_agents_list(self):
         """
-        Returns a list of all loaded agents with their descriptions.
+        Returns a list of all discovered agents with their descriptions.
         """
         return [{"name": name, "description": data["description"]} for name, data in self.agents.items()]
 
+    def get_agents_signature(self):
+        """
+        Returns a hash of the loaded agent names and descriptions. The signature changes
+        whenever the agent set changes, so caches built on top of it can be invalidated.
+        """
+        agents = "\n".join(f"{name}:{data['description']}" for name, data in sorted(self.agents.items()))
+        return hashlib.sha256(agents.encode("utf-8")).hexdigest()
+
     def get_agent_by_name(self, name):
         """
-        Retrieves an agent instance by filename-based name if it exists in the loaded agents.
+        Retrieves an agent instance by filename-based name, instantiating it on first use.
+        Returns None for unknown agents and agents that failed to load (until their retry).
         """
-        return self.agents.get(name, {}).get("instance")
+        if name not in self.agents:
+            return None
+        return self._instantiate(name)
@@ -1,22 +1,51 @@
 # ollama_rag.py
+import os
+import hashlib
 from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.vectorstores import Chroma
 from langchain_community import embeddings
 from langchain_community.chat_models import ChatOllama
 from langchain_core.messages import HumanMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain.text_splitter import CharacterTextSplitter
+from embedding_cache import CachedEmbeddings
+from tracing import span
+try:
+    from vector_index import VectorIndex
+except ModuleNotFoundError as e:  # NumPy not installed: every corpus goes to Chroma
+    if e.name != "numpy":
+        raise
+    VectorIndex = None
+
+# Retriever backend: "auto" uses the in-process index for corpora of at most INDEX_MAX_CHUNKS chunks
+# and Chroma for larger ones; "index" and "chroma" force one of them
+RAG_BACKEND = os.environ.get("SIHTEERI_RAG_BACKEND", "auto")
+INDEX_MAX_CHUNKS = int(os.environ.get("SIHTEERI_INDEX_MAX_CHUNKS", "5000"))
+BM25_WEIGHT = float(os.environ.get("SIHTEERI_RAG_BM25_WEIGHT", "0"))
 
 class OllamaRAG:
-    def __init__(self, model_name="llama3.2", embedding_model="nomic-embed-text", collection_name="rag-chroma"):
+    def __init__(self, model_name="llama3.2", embedding_model="nomic-embed-text", collection_name="rag-chroma",
+                 persist_directory="chroma_db", base_url=None, backend=RAG_BACKEND, index_max_chunks=INDEX_MAX_CHUNKS,
+                 bm25_weight=BM25_WEIGHT):
         """
         Initializes the RAG utility for document retrieval and generation using Llama3.2.
+        The vector store is persisted in persist_directory so embeddings survive restarts.
+        Small corpora are searched with an in-process VectorIndex instead of Chroma (see backend);
+        bm25_weight blends a BM25 keyword score into its ranking.
         """
-        self.llm = ChatOllama(model=model_name)
-        self.embedding_model = embeddings.OllamaEmbeddings(model=embedding_model)
+        # OLLAMA_BASE_URL points the client at another Ollama server, e.g. a local stand-in for benchmarks
+        base_url = base_url or os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+        self.llm = ChatOllama(model=model_name, base_url=base_url)
+        self.embedding_model_name = embedding_model
+        # Embeddings are cached on disk, so repeated queries and unchanged chunks are not embedded again
+        self.embedding_model = CachedEmbeddings(embeddings.OllamaEmbeddings(model=embedding_model, base_url=base_url), embedding_model)
         self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.backend = backend
+        self.index_max_chunks = index_max_chunks
+        self.bm25_weight = bm25_weight
         self.vectorstore = None
         self.retriever = None
+        self.corpus_hash = None
 
     def load_and_split_documents(self, urls):
         """
@@ -27,29 +56,118 @@ class OllamaRAG:
         text_splitter = CharacterTextSplitter.from_tiktoken_encoder(chunk_size=7500, chunk_overlap=100)
         return text_splitter.split_documents(docs_list)
 
+    def chunk_id(self, text):
+        """
+        Returns a content address for a chunk: the hash of its text and the embedding model,
+        so a chunk is embedded again only if either of them changes.
+        """
+        return hashlib.sha256(f"{self.embedding_model_name}\n{text}".encode("utf-8")).hexdigest()
+
     def setup_vectorstore(self, urls):
         """
-        Initializes the Chroma vector store with embeddings.
+        Loads the documents from the urls and indexes their chunks, see setup_documents.
         """
-        doc_splits = self.load_and_split_documents(urls)
-        self.vectorstore = Chroma.from_documents(documents=doc_splits, collection_name=self.collection_name, embedding=self.embedding_model)
-        self.retriever = self.vectorstore.as_retriever()
+        self.setup_documents(self.load_and_split_documents(urls))
 
-    def query(self, prompt):
+    def setup_documents(self, doc_splits):
         """
-        Performs a RAG query and generates a response.
+        Indexes the chunks with the backend chosen for the corpus size. Only new or changed
+        chunks are embedded, and chunks no longer in the documents are deleted, so the
+        collection must be dedicated to this set of documents.
         """
-        if not self.retriever:
-            return "Vector store is not set up."
+        # Deduplicate identical chunks by their content address
+        chunks = {}
+        for doc in doc_splits:
+            chunks.setdefault(self.chunk_id(doc.page_content), doc)
+
+        backend = self._select_backend(len(chunks))
+        with span(f"ollama.index.{backend}"):
+            if backend == "index":
+                self._setup_index(chunks)
+            else:
+                self._setup_chroma(chunks)
+        print("Embedding cache:", self.embedding_model.stats())
+
+        # Identifies the current document contents, e.g. for caching answers derived from them
+        self.corpus_hash = hashlib.sha256("".join(sorted(chunks)).encode("utf-8")).hexdigest()
+
+    def _select_backend(self, chunk_count):
+        if self.backend == "chroma" or VectorIndex is None:
+            return "chroma"
+        if self.backend == "index" or chunk_count <= self.index_max_chunks:
+            return "index"
+        return "chroma"
+
+    def _setup_index(self, chunks):
+        """
+        Builds the in-process index, memory-mapped from persist_directory.
+        """
+        index = self.vectorstore if isinstance(self.vectorstore, VectorIndex) else VectorIndex(
+            self.embedding_model, path=os.path.join(self.persist_directory, f"{self.collection_name}.index"),
+            bm25_weight=self.bm25_weight
+        )
+        embedded = index.build(chunks)
+        print(f"Vector index {self.collection_name}: {embedded} chunks embedded, {len(chunks) - embedded} reused.")
+        self.vectorstore = self.retriever = index
+
+    def _setup_chroma(self, chunks):
+        """
+        Updates the persistent Chroma collection with the chunks.
+        """
+        # Imported here: Chroma is slow to import and only needed for large corpora
+        from langchain_community.vectorstores import Chroma
 
-        query_results = self.retriever.invoke(prompt)
+        vectorstore = Chroma(collection_name=self.collection_name, embedding_function=self.embedding_model,
+                             persist_directory=self.persist_directory)
+        existing_ids = set(vectorstore.get(include=[])["ids"])
+        stale_ids = list(existing_ids - chunks.keys())
+        new_ids = [chunk_id for chunk_id in chunks if chunk_id not in existing_ids]
+
+        if stale_ids:
+            vectorstore.delete(ids=stale_ids)
+        if new_ids:
+            vectorstore.add_documents([chunks[chunk_id] for chunk_id in new_ids], ids=new_ids)
+        print(f"Vector store {self.collection_name}: {len(new_ids)} chunks embedded, "
+              f"{len(stale_ids)} removed, {len(chunks) - len(new_ids)} reused.")
+        self.vectorstore = vectorstore
+        self.retriever = vectorstore.as_retriever()
+
+    def _build_message(self, prompt):
+        """
+        Retrieves the relevant content for the prompt and builds the message for the LLM.
+        """
+        with span("ollama.retrieve"):
+            query_results = self.retriever.invoke(prompt)
         if query_results:
             rag_content = " ".join([doc.page_content for doc in query_results])
         else:
             rag_content = "No relevant content found."
 
         content_parts = [{"type": "text", "text": rag_content}, {"type": "text", "text": prompt}]
-        message = HumanMessage(content=content_parts)
-        
+        return HumanMessage(content=content_parts)
+
+    def query(self, prompt):
+        """
+        Performs a RAG query and generates a response.
+        """
+        if not self.retriever:
+            return "Vector store is not set up."
+
+        message = self._build_message(prompt)
         output_parser = StrOutputParser()
-        return output_parser.invoke(self.llm.invoke([message]))
+        with span("ollama.generate"):
+            return output_parser.invoke(self.llm.invoke([message]))
+
+    def query_stream(self, prompt):
+        """
+        Performs a RAG query and yields the response tokens as the LLM generates them.
+        """
+        if not self.retriever:
+            yield "Vector store is not set up."
+            return
+
+        message = self._build_message(prompt)
+        with span("ollama.generate_stream"):
+            for chunk in self.llm.stream([message]):
+                if chunk.content:
+                    yield chunk.content
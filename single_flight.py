@@ -0,0 +1,107 @@
+# single_flight.py
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, Executor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from tracing import count
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical work: while a computation for a key is in flight, further
+    callers with the same key share its result instead of starting their own.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls: Dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable, *args) -> Any:
+        """
+        Runs fn(*args) in the calling thread, or waits for the in-flight call with the same key.
+        Exceptions are propagated to every waiter.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            count("sihteeri_coalesced_total", flight=self.name)
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._forget(key, future)
+            future.set_exception(e)
+            raise
+        self._forget(key, future)
+        future.set_result(result)
+        return result
+
+    def submit(self, key: Hashable, executor: Executor, fn: Callable, *args) -> Future:
+        """
+        Submits fn(*args) to the executor, or returns the future of the in-flight call with the
+        same key. Waiters do not occupy executor threads.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            shared = future is not None
+            if shared:
+                self.shared += 1
+            else:
+                future = self.calls[key] = executor.submit(fn, *args)
+                self.leaders += 1
+        if shared:
+            count("sihteeri_coalesced_total", flight=self.name)
+            return future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: Hashable, future: Future):
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the number of calls started, calls that shared an in-flight result and calls in flight.
+        """
+        with self.lock:
+            return {"leaders": self.leaders, "shared": self.shared, "in_flight": len(self.calls)}
+
+class ResponseCache:
+    """
+    Short-lived cache of rendered responses keyed by an idempotency key such as Twilio's
+    MessageSid, so that webhook retries are answered without recomputing the reply.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                return entry[0]
+            self.entries.pop(key, None)
+        return None
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -1,27 +1,316 @@
 # storage.py
+import os
+import re
+import sys
 import sqlite3
+import weakref
 import datetime
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import List, Optional, Dict, Any, Union
 
+from tracing import traced, count, log
+
+# Table written by an INSERT, REPLACE, UPDATE or DELETE statement
+WRITE_PATTERN = re.compile(r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+(\w+)", re.IGNORECASE)
+
+# Development aid: set SIHTEERI_EXPLAIN=1 to log the queries built by Storage that scan a whole table
+EXPLAIN_QUERIES = os.environ.get("SIHTEERI_EXPLAIN") == "1"
+
+# Integer date columns: "day" stores YYYYMMDD, "epoch" stores Unix seconds
+DATE_KINDS = ("day", "epoch")
+
+def to_db_date(value, kind: str):
+    """
+    Converts a datetime, date or ISO 8601 string to the integer stored in a date column of the given kind.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if kind == "day":
+        return value.year * 10000 + value.month * 100 + value.day
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    return int(value.timestamp())
+
+def from_db_date(value, kind: str):
+    """
+    Converts a stored integer date back to an ISO 8601 string.
+    """
+    if value is None:
+        return None
+    if kind == "day":
+        return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}"
+    return datetime.datetime.fromtimestamp(value).isoformat(sep=" ")
+
+# Per-table write counters shared through the database, so that every process and Storage instance
+# sees the writes of the others. A connection's PRAGMA data_version changes when another connection
+# commits, so the counters are only reread after such a commit.
+VERSIONS_TABLE = "storage_versions"
+
+# Live Storage instances, so that a forked child process can drop the connections it inherited
+_instances = weakref.WeakSet()
+
+def _reset_after_fork():
+    for storage in list(_instances):
+        storage._forget_connections()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+class _ThreadConnection:
+    """
+    Holds a thread's connection in its thread-local storage. The holder is released when the
+    thread exits, which closes the connection.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+def _close_connection(conn: sqlite3.Connection, pid: int):
+    if os.getpid() != pid:
+        return  # Inherited over a fork: the connection belongs to the parent process
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
 class Storage:
-    def __init__(self, db_path: str = "sihteeri.db"):
+    def __init__(self, db_path: str = "sihteeri.db", cache_size_kb: int = 8192, cached_statements: int = 256, query_cache_bytes: int = 0,
+                 explain_queries: bool = EXPLAIN_QUERIES):
         """
         Initializes the Storage class with a path to the SQLite database.
         
         Parameters:
             db_path (str): The path to the SQLite database file.
+            cache_size_kb (int): Page cache size of each connection in kilobytes.
+            cached_statements (int): Number of prepared statements cached per connection.
+            query_cache_bytes (int): Memory cap of the query-result cache used by fetch_all and
+                fetch_rows_by_date_range. 0 disables the cache.
+            explain_queries (bool): Run EXPLAIN QUERY PLAN on each new query built by Storage and
+                log the ones that scan a whole table.
         """
         self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.connections = weakref.WeakSet()  # _ThreadConnection of each thread that has a connection
+        self.connections_lock = threading.Lock()
+
+        # Query-result cache: (SQL, params) -> (table version, rows, size). Writes made through any
+        # Storage, in any process, bump the table's version in VERSIONS_TABLE in the same transaction,
+        # which invalidates the cached results.
+        self.query_cache_bytes = query_cache_bytes
+        self.query_cache = OrderedDict()
+        self.query_cache_used = 0
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        self.table_versions = {}
+        self.query_cache_lock = threading.Lock()
+
+        self.date_columns = {}  # table -> {column: "day" or "epoch"}, from create_table
+        self.explain_queries = explain_queries
+        self.explained = set()
+        _instances.add(self)
 
     def _connect(self) -> sqlite3.Connection:
         """
-        Establishes a connection to the SQLite database.
+        Returns the calling thread's persistent connection to the SQLite database,
+        opening and tuning it on first use. The connection is closed when the thread exits.
         
         Returns:
             sqlite3.Connection: A SQLite connection object.
         """
-        return sqlite3.connect(self.db_path)
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit mode: single statements commit on their own, reads never commit,
+            # and transaction() groups writes explicitly
+            # Only the owning thread uses the connection, but close() and the thread-exit
+            # finalizer may close it from another thread
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                   cached_statements=self.cached_statements, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{self.cache_size_kb}")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            holder = _ThreadConnection(conn)
+            weakref.finalize(holder, _close_connection, conn, os.getpid())
+            self.local.holder = holder
+            self.local.conn = conn
+            self.local.depth = 0
+            self.local.data_version = None
+            with self.connections_lock:
+                self.connections.add(holder)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups the writes made inside the block into a single transaction that is committed
+        on exit and rolled back on error. Nested blocks join the outermost transaction.
+        
+        Example:
+            with storage.transaction():
+                for row in rows:
+                    storage.insert_data("assignments", row)
+        """
+        conn = self._connect()
+        if self.local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self.local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self.local.depth -= 1
+        if self.local.depth == 0:
+            conn.execute("COMMIT")
+            # This connection's own commits do not change its data_version
+            self.local.data_version = None
+
+    def _written(self, conn: sqlite3.Connection, table: str):
+        """
+        Bumps the version of table. Called inside the transaction of the write, so that the new
+        version becomes visible to other connections together with the written rows.
+        """
+        conn.execute(f"INSERT INTO {VERSIONS_TABLE} (name, version) VALUES (?, 1) "
+                     f"ON CONFLICT(name) DO UPDATE SET version = version + 1", (table,))
+
+    def _table_version(self, conn: sqlite3.Connection, table: str) -> int:
+        """
+        Returns the current version of table, rereading the versions only when another
+        connection has committed since this thread last read them.
+        """
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.local.data_version:
+            versions = dict(conn.execute(f"SELECT name, version FROM {VERSIONS_TABLE}").fetchall())
+            with self.query_cache_lock:
+                self.table_versions = versions
+            self.local.data_version = data_version
+        return self.table_versions.get(table, 0)
+
+    def _cached_rows(self, table: str, query: str, params: tuple) -> List[Dict[str, Any]]:
+        """
+        Runs a SELECT on a single table and returns the rows as dictionaries, from the query-result
+        cache when the table has not been written since. Cached rows are shared between callers
+        and must not be modified.
+        """
+        conn = self._connect()
+        if not self.query_cache_bytes or self.local.depth:
+            # Reads inside a transaction may see writes that are later rolled back
+            return self._fetch_dicts(table, query, params)
+
+        key = (query, params)
+        version = self._table_version(conn, table)
+        with self.query_cache_lock:
+            entry = self.query_cache.get(key)
+            if entry and entry[0] == version:
+                self.query_cache.move_to_end(key)
+                self.query_cache_hits += 1
+                hit = True
+            else:
+                self.query_cache_misses += 1
+                hit = False
+        if hit:
+            count("sihteeri_query_cache_total", result="hit")
+            return entry[1]
+
+        count("sihteeri_query_cache_total", result="miss")
+        # The version was read before the query, so a concurrent write makes this entry stale
+        rows = self._fetch_dicts(table, query, params)
+        size = sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values()) for row in rows)
+        if size > self.query_cache_bytes:
+            return rows
+        with self.query_cache_lock:
+            previous = self.query_cache.pop(key, None)
+            if previous:
+                self.query_cache_used -= previous[2]
+            self.query_cache[key] = (version, rows, size)
+            self.query_cache_used += size
+            while self.query_cache_used > self.query_cache_bytes:
+                _, (_, _, evicted) = self.query_cache.popitem(last=False)
+                self.query_cache_used -= evicted
+        return rows
+
+    def _fetch_dicts(self, table: str, query: str, params: tuple) -> List[Dict[str, Any]]:
+        cursor = self._connect().execute(query, params)
+        rows = cursor.fetchall()
+        column_names = [description[0] for description in cursor.description]
+        rows = [dict(zip(column_names, row)) for row in rows]
+        date_columns = self.date_columns.get(table)
+        if date_columns:
+            for row in rows:
+                for column, kind in date_columns.items():
+                    if column in row:
+                        row[column] = from_db_date(row[column], kind)
+        return rows
+
+    def _to_db(self, table: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Converts the values of the table's integer date columns in data for storing.
+        """
+        date_columns = self.date_columns.get(table)
+        if not date_columns:
+            return data
+        return {col: to_db_date(value, date_columns[col]) if col in date_columns else value for col, value in data.items()}
 
+    def explain(self, query: str, params: Optional[tuple] = None) -> List[str]:
+        """
+        Returns the EXPLAIN QUERY PLAN details of a query, e.g. "SEARCH assignments USING INDEX ...".
+        """
+        return [row[3] for row in self._connect().execute(f"EXPLAIN QUERY PLAN {query}", params or ())]
+
+    def _check_plan(self, query: str, params: tuple):
+        """
+        Logs the query once if its plan scans a whole table, when explain_queries is enabled.
+        """
+        if not self.explain_queries or query in self.explained:
+            return
+        self.explained.add(query)
+        scans = [detail for detail in self.explain(query, params) if detail.startswith("SCAN ")]
+        if scans:
+            log("full_table_scan", query=query, plan=scans)
+
+    def query_cache_stats(self) -> Dict[str, Any]:
+        """
+        Returns hit/miss counters and the size of the query-result cache.
+        """
+        with self.query_cache_lock:
+            total = self.query_cache_hits + self.query_cache_misses
+            return {
+                "hits": self.query_cache_hits,
+                "misses": self.query_cache_misses,
+                "hit_rate": self.query_cache_hits / total if total else 0.0,
+                "entries": len(self.query_cache),
+                "bytes": self.query_cache_used
+            }
+
+    def close(self):
+        """
+        Closes all connections opened by this Storage instance.
+        """
+        with self.connections_lock:
+            for holder in list(self.connections):
+                _close_connection(holder.conn, os.getpid())
+            self.connections.clear()
+        self.local = threading.local()
+
+    def _forget_connections(self):
+        """
+        Drops the connections inherited over a fork without closing them: SQLite connections must
+        not be used across a fork, and closing them in the child could release the parent's locks.
+        """
+        self.local = threading.local()
+        self.connections = weakref.WeakSet()
+        self.connections_lock = threading.Lock()
+
+    @traced("storage.execute_query")
     def execute_query(self, query: str, params: Optional[tuple] = None) -> List[tuple]:
         """
         Executes a given SQL query with optional parameters.
@@ -33,12 +322,15 @@ class Storage:
         Returns:
             list: The fetched rows from the database for SELECT queries.
         """
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params or ())
-            conn.commit()
-            return cursor.fetchall()
+        match = WRITE_PATTERN.match(query)
+        if not match:
+            return self._connect().execute(query, params or ()).fetchall()
+        with self.transaction() as conn:
+            rows = conn.execute(query, params or ()).fetchall()
+            self._written(conn, match.group(1))
+            return rows
 
+    @traced("storage.insert_data")
     def insert_data(self, table: str, data: Dict[str, Any], unique_columns: Optional[List[str]] = None) -> Union[int, str]:
         """
         Inserts data into a specified table, checking for duplicates if unique_columns is provided.
@@ -51,25 +343,64 @@ class Storage:
         Returns:
             int or str: The ID of the newly inserted row, or a message if duplicate.
         """
-        # Check for duplicates if unique_columns are specified
-        if unique_columns:
-            where_clause = " AND ".join([f"{col} = ?" for col in unique_columns])
-            check_query = f"SELECT id FROM {table} WHERE {where_clause}"
-            check_params = tuple(data[col] for col in unique_columns)
-            if self.execute_query(check_query, check_params):
-                return f"Duplicate entry detected in {table} for {unique_columns}."
-
-        # Insert the data
+        data = self._to_db(table, data)
         columns = ', '.join(data.keys())
         placeholders = ', '.join(['?'] * len(data))
         query = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
-        
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, tuple(data.values()))
-            conn.commit()
+
+        # The duplicate check and the insert share one connection and transaction
+        with self.transaction() as conn:
+            # Check for duplicates if unique_columns are specified
+            if unique_columns:
+                where_clause = " AND ".join([f"{col} = ?" for col in unique_columns])
+                check_query = f"SELECT id FROM {table} WHERE {where_clause}"
+                check_params = tuple(data[col] for col in unique_columns)
+                self._check_plan(check_query, check_params)
+                if conn.execute(check_query, check_params).fetchone():
+                    return f"Duplicate entry detected in {table} for {unique_columns}."
+
+            # Insert the data
+            cursor = conn.execute(query, tuple(data.values()))
+            self._written(conn, table)
             return cursor.lastrowid
 
+    @traced("storage.upsert_many")
+    def upsert_many(self, table: str, rows: List[Dict[str, Any]], conflict_columns: List[str], update_columns: Optional[List[str]] = None) -> int:
+        """
+        Inserts many rows in a single transaction, updating the existing rows that conflict
+        on conflict_columns instead.
+        
+        Parameters:
+            table (str): The name of the table.
+            rows (list): Dictionaries of column-value pairs, all with the same columns.
+            conflict_columns (list): Columns of the UNIQUE constraint used to detect existing rows.
+            update_columns (list): Columns to overwrite on conflict. Conflicting rows are left
+                untouched if omitted.
+        
+        Returns:
+            int: The number of rows inserted or updated.
+        """
+        if not rows:
+            return 0
+
+        if table in self.date_columns:
+            rows = [self._to_db(table, row) for row in rows]
+        columns = list(rows[0].keys())
+        placeholders = ', '.join(['?'] * len(columns))
+        conflict = ', '.join(conflict_columns)
+        if update_columns:
+            assignments = ', '.join([f"{col} = excluded.{col}" for col in update_columns])
+            on_conflict = f"DO UPDATE SET {assignments}"
+        else:
+            on_conflict = "DO NOTHING"
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) ON CONFLICT({conflict}) {on_conflict}"
+
+        with self.transaction() as conn:
+            cursor = conn.executemany(query, [tuple(row[col] for col in columns) for row in rows])
+            self._written(conn, table)
+            return cursor.rowcount
+
+    @traced("storage.fetch_all")
     def fetch_all(self, table: str) -> List[Dict[str, Any]]:
         """
         Fetches all rows from a specified table.
@@ -80,13 +411,9 @@ class Storage:
         Returns:
             list: A list of dictionaries representing each row.
         """
-        query = f"SELECT * FROM {table}"
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            rows = cursor.execute(query).fetchall()
-            column_names = [description[0] for description in cursor.description]
-            return [dict(zip(column_names, row)) for row in rows]
+        return self._cached_rows(table, f"SELECT * FROM {table}", ())
 
+    @traced("storage.update_data")
     def update_data(self, table: str, data: Dict[str, Any], where_clause: str, where_args: tuple) -> bool:
         """
         Updates data in a specified table based on a condition.
@@ -100,27 +427,62 @@ class Storage:
         Returns:
             bool: True if any rows were updated, False otherwise.
         """
+        data = self._to_db(table, data)
         columns = ', '.join([f"{col} = ?" for col in data.keys()])
         query = f"UPDATE {table} SET {columns} WHERE {where_clause}"
-        
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, tuple(data.values()) + where_args)
-            conn.commit()
+        params = tuple(data.values()) + where_args
+
+        self._check_plan(query, params)
+        with self.transaction() as conn:
+            cursor = conn.execute(query, params)
+            self._written(conn, table)
             return cursor.rowcount > 0
 
     def create_table(self, schema: dict):
         """
-        Creates a table based on the provided schema if it doesn't exist.
+        Creates a table and its indexes based on the provided schema if they don't exist.
         
         Parameters:
-            schema (dict): A dictionary defining table structure.
+            schema (dict): A dictionary defining table structure:
+                "table": the table name,
+                "fields": column name -> column definition,
+                "constraints": optional table constraints, e.g. "UNIQUE(title, due_date)",
+                "indexes": optional list of {"columns": [...], "name": ..., "unique": bool,
+                    "where": ...}; "where" makes a partial index, e.g. "status = 'pending'",
+                "date_columns": optional column -> "day" or "epoch". These INTEGER columns store
+                    dates as YYYYMMDD or Unix seconds; Storage converts datetimes and ISO strings
+                    on write and returns ISO strings from fetch_all and fetch_rows_by_date_range.
+        
+        Example:
+            storage.create_table({
+                "table": "assignments",
+                "fields": {"id": "INTEGER PRIMARY KEY AUTOINCREMENT", "title": "TEXT NOT NULL",
+                           "due_date": "INTEGER NOT NULL", "status": "TEXT NOT NULL"},
+                "indexes": [{"columns": ["status", "due_date"], "where": "status = 'pending'"}],
+                "date_columns": {"due_date": "day"}
+            })
         """
+        table = schema["table"]
+        date_columns = schema.get("date_columns", {})
+        for column, kind in date_columns.items():
+            if kind not in DATE_KINDS:
+                raise ValueError(f"Unknown date column kind {kind!r} for {table}.{column}, expected one of {DATE_KINDS}.")
+        if date_columns:
+            self.date_columns[table] = dict(date_columns)
+
         fields = ', '.join([f"{field} {type}" for field, type in schema["fields"].items()])
         constraints = ', '.join(schema.get("constraints", []))
-        query = f"CREATE TABLE IF NOT EXISTS {schema['table']} ({fields} {', ' if constraints else ''}{constraints})"
+        query = f"CREATE TABLE IF NOT EXISTS {table} ({fields} {', ' if constraints else ''}{constraints})"
         self.execute_query(query)
 
+        for index in schema.get("indexes", []):
+            columns = index["columns"]
+            name = index.get("name") or f"idx_{table}_" + "_".join(col.split()[0] for col in columns)
+            unique = "UNIQUE " if index.get("unique") else ""
+            where = f" WHERE {index['where']}" if index.get("where") else ""
+            self.execute_query(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)}){where}")
+
+    @traced("storage.fetch_rows_by_date_range")
     def fetch_rows_by_date_range(self, table: str, date_column: str, start_date: datetime, end_date: datetime, **conditions):
         """
         Fetches rows where a date column falls within a range and meets additional conditions.
@@ -135,17 +497,18 @@ class Storage:
         Returns:
             list: Rows meeting the conditions as dictionaries.
         """
+        conditions = self._to_db(table, conditions)
         conditions_query = " AND ".join([f"{col} = ?" for col in conditions.keys()])
         full_query = f"SELECT * FROM {table} WHERE {date_column} BETWEEN ? AND ? {f'AND {conditions_query}' if conditions else ''}"
-        params = (start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")) + tuple(conditions.values())
-        
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute(full_query, params)
-            rows = cursor.fetchall()
-            column_names = [description[0] for description in cursor.description]
-            
-        return [dict(zip(column_names, row)) for row in rows]
+        kind = self.date_columns.get(table, {}).get(date_column)
+        if kind:
+            bounds = (to_db_date(start_date, kind), to_db_date(end_date, kind))
+        else:
+            bounds = (start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"))
+        params = bounds + tuple(conditions.values())
+
+        self._check_plan(full_query, params)
+        return self._cached_rows(table, full_query, params)
 
     def list_tables(self) -> List[str]:
         """
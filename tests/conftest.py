@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# The modules are imported from the repository root, as backend.py and the agents do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
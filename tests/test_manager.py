@@ -0,0 +1,31 @@
+# tests/test_manager.py
+import manager as manager_module
+from manager import Manager
+
+class FlakyProcessAgent:
+    """
+    Stands in for ProcessAgent: the first worker start fails, the later ones succeed.
+    """
+    starts = 0
+
+    def __init__(self, name, module, class_name, **options):
+        FlakyProcessAgent.starts += 1
+        if FlakyProcessAgent.starts == 1:
+            raise RuntimeError("worker process did not start")
+
+    def start_background_tasks(self):
+        pass
+
+def test_process_agent_loads_on_retry_after_failure(monkeypatch):
+    monkeypatch.setattr(manager_module, "ProcessAgent", FlakyProcessAgent)
+    monkeypatch.setattr(manager_module, "LOAD_RETRY_BASE", 0)  # Retry on the next use
+    manager = Manager(process_agents={"menu_agent": {"workers": 1, "timeout": 60}})
+
+    assert manager.get_agent_by_name("menu_agent") is None
+    assert "failed (RuntimeError: worker process did not start)" in manager.get_startup_report()
+
+    assert manager.get_agent_by_name("menu_agent") is not None
+    data = manager.agents["menu_agent"]
+    assert data["error"] is None
+    assert data["failures"] == 0
+    assert "failed" not in manager.get_startup_report()
@@ -0,0 +1,86 @@
+# tests/test_storage.py
+import gc
+import os
+import threading
+
+import pytest
+
+from storage import Storage
+
+QUERY_CACHE_BYTES = 1024 * 1024
+
+SCHEMA = {
+    "table": "assignments",
+    "fields": {
+        "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "title": "TEXT NOT NULL",
+        "due_date": "INTEGER NOT NULL",
+        "status": "TEXT NOT NULL DEFAULT 'pending'"
+    },
+    "constraints": ["UNIQUE(title, due_date)"],
+    "date_columns": {"due_date": "day"}
+}
+
+@pytest.fixture
+def db_path(tmp_path):
+    return os.path.join(tmp_path, "sihteeri.db")
+
+def open_storage(db_path, **kwargs):
+    storage = Storage(db_path, **kwargs)
+    storage.create_table(SCHEMA)
+    return storage
+
+def titles(rows):
+    return sorted((row["title"], row["status"]) for row in rows)
+
+def test_query_cache_sees_writes_of_another_instance(db_path):
+    writer = open_storage(db_path, query_cache_bytes=QUERY_CACHE_BYTES)
+    reader = open_storage(db_path, query_cache_bytes=QUERY_CACHE_BYTES)
+    writer.insert_data("assignments", {"title": "hw1", "due_date": "2026-10-20"})
+
+    assert titles(reader.fetch_all("assignments")) == [("hw1", "pending")]
+    assert titles(reader.fetch_all("assignments")) == [("hw1", "pending")]
+    assert reader.query_cache_stats()["hits"] == 1
+
+    writer.upsert_many("assignments", [{"title": "hw2", "due_date": "2026-10-21", "status": "pending"}],
+                       conflict_columns=["title", "due_date"])
+    writer.update_data("assignments", {"status": "completed"}, "title = ?", ("hw1",))
+    assert titles(reader.fetch_all("assignments")) == [("hw1", "completed"), ("hw2", "pending")]
+
+    writer.execute_query("DELETE FROM assignments WHERE title = ?", ("hw2",))
+    assert titles(reader.fetch_all("assignments")) == [("hw1", "completed")]
+
+def test_query_cache_sees_writes_of_an_uncached_instance(db_path):
+    reader = open_storage(db_path, query_cache_bytes=QUERY_CACHE_BYTES)
+    writer = open_storage(db_path)
+    assert reader.fetch_all("assignments") == []
+
+    writer.insert_data("assignments", {"title": "hw1", "due_date": "2026-10-20"})
+    assert titles(reader.fetch_all("assignments")) == [("hw1", "pending")]
+
+def test_query_cache_ignores_rolled_back_writes(db_path):
+    storage = open_storage(db_path, query_cache_bytes=QUERY_CACHE_BYTES)
+    storage.insert_data("assignments", {"title": "hw1", "due_date": "2026-10-20"})
+
+    with pytest.raises(RuntimeError):
+        with storage.transaction():
+            storage.update_data("assignments", {"status": "completed"}, "title = ?", ("hw1",))
+            assert titles(storage.fetch_all("assignments")) == [("hw1", "completed")]
+            raise RuntimeError("rollback")
+    assert titles(storage.fetch_all("assignments")) == [("hw1", "pending")]
+
+def test_connections_of_finished_threads_are_closed(db_path):
+    storage = open_storage(db_path)
+
+    def query():
+        storage.execute_query("SELECT COUNT(*) FROM assignments")
+
+    for _ in range(200):
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+    gc.collect()
+    assert len(storage.connections) == 1  # This thread's, from create_table
+
+    storage.close()
+    assert len(storage.connections) == 0
@@ -0,0 +1,60 @@
+# tests/test_work_queue.py
+import os
+import time
+
+import pytest
+
+from storage import Storage
+from work_queue import WorkQueue
+
+@pytest.fixture
+def storage(tmp_path):
+    return Storage(os.path.join(tmp_path, "sihteeri.db"))
+
+def test_failed_job_waits_for_its_retry_delay(storage):
+    queue = WorkQueue(storage, max_attempts=3, retry_delay=0.2)
+    queue.enqueue("SM1", "whatsapp:+358401", "whatsapp:+358402", "menu")
+
+    job = queue.claim()
+    queue.fail(job, "Twilio down")
+    assert queue.claim() is None
+
+    time.sleep(0.25)
+    job = queue.claim()
+    assert job["attempts"] == 2
+    queue.fail(job, "Twilio down")
+    time.sleep(0.25)
+    assert queue.claim() is None  # The second delay is twice the first
+
+    time.sleep(0.2)
+    job = queue.claim()
+    assert job["attempts"] == 3
+    queue.fail(job, "Twilio down")
+    assert storage.execute_query("SELECT status, result FROM work_queue")[0] == ("failed", "Twilio down")
+
+def test_expired_lease_is_reclaimed_once(tmp_path):
+    db_path = os.path.join(tmp_path, "sihteeri.db")
+    crashed = WorkQueue(Storage(db_path), lease=0.2)
+    worker = WorkQueue(Storage(db_path), lease=0.2)
+    crashed.enqueue("SM1", "whatsapp:+358401", "whatsapp:+358402", "menu")
+
+    stale_job = crashed.claim()
+    assert worker.claim() is None
+
+    time.sleep(0.25)
+    job = worker.claim()
+    assert job["id"] == stale_job["id"] and job["attempts"] == 2
+    assert crashed.claim() is None  # The compare-and-set lets only one worker claim it
+
+    crashed.complete(stale_job, "stale answer")
+    worker.complete(job, "answer")
+    assert worker.storage.execute_query("SELECT status, result FROM work_queue")[0] == ("done", "answer")
+
+def test_expired_last_attempt_fails_the_job(storage):
+    queue = WorkQueue(storage, max_attempts=1, lease=0.1)
+    queue.enqueue("SM1", "whatsapp:+358401", "whatsapp:+358402", "menu")
+    assert queue.claim() is not None
+
+    time.sleep(0.15)
+    assert queue.claim() is None
+    assert storage.execute_query("SELECT status, result FROM work_queue")[0] == ("failed", "Lease expired")
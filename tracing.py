@@ -0,0 +1,160 @@
+# tracing.py
+import os
+import json
+import time
+import uuid
+import bisect
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+""" Lightweight tracing: latency histograms and counters per span, exposed in Prometheus text format,
+and structured logs tagged with the current request ID. Set SIHTEERI_TRACING=0 to disable; spans
+then cost a single flag check and traced functions are not wrapped at all. """
+
+ENABLED = os.environ.get("SIHTEERI_TRACING", "1") == "1"
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+logger = logging.getLogger("sihteeri")
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+class Registry:
+    """
+    Holds the span histograms and counters.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, span_name, seconds, error=False):
+        with self.lock:
+            histogram = self.histograms.get(span_name)
+            if histogram is None:
+                histogram = self.histograms[span_name] = Histogram()
+            histogram.observe(seconds)
+        if error:
+            self.increment("sihteeri_span_errors_total", (("span", span_name),))
+
+    def increment(self, name, labels, amount=1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP sihteeri_span_duration_seconds Duration of traced operations.",
+            "# TYPE sihteeri_span_duration_seconds histogram"
+        ]
+        with self.lock:
+            for span_name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(f'sihteeri_span_duration_seconds_bucket{{span="{span_name}",le="{bound}"}} {cumulative}')
+                lines.append(f'sihteeri_span_duration_seconds_bucket{{span="{span_name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'sihteeri_span_duration_seconds_sum{{span="{span_name}"}} {histogram.total}')
+                lines.append(f'sihteeri_span_duration_seconds_count{{span="{span_name}"}} {histogram.count}')
+
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f"# TYPE {name} counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        label_text = ",".join(f'{key}="{value_}"' for key, value_ in labels)
+                        lines.append(f'{name}{{{label_text}}} {value}')
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+@contextmanager
+def _span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.observe(name, time.perf_counter() - started, error=True)
+        raise
+    registry.observe(name, time.perf_counter() - started)
+
+def span(name):
+    """
+    Context manager that records the duration of the block under the span name.
+    """
+    if not ENABLED:
+        return nullcontext()
+    return _span(name)
+
+def traced(name):
+    """
+    Decorator that records every call of the function under the span name. Returns the
+    function unchanged when tracing is disabled.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument(obj, prefix):
+    """
+    Wraps the public methods of an object so that every call is recorded as prefix.method.
+    Generator methods are left alone, since a span would only time their creation.
+    """
+    if not ENABLED:
+        return obj
+    for attr_name, method in inspect.getmembers(obj, inspect.ismethod):
+        if attr_name.startswith("_") or inspect.isgeneratorfunction(method):
+            continue
+        setattr(obj, attr_name, traced(f"{prefix}.{attr_name}")(method))
+    return obj
+
+def count(name, amount=1, **labels):
+    """
+    Increments a counter, e.g. count("sihteeri_requests_total", route="whatsapp").
+    """
+    if ENABLED:
+        registry.increment(name, tuple(sorted(labels.items())), amount)
+
+def new_request_id():
+    """
+    Starts a new request: generates a request ID and attaches it to the current context.
+    """
+    request_id = uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    return request_id
+
+def log(event, **fields):
+    """
+    Writes a structured (JSON) log line tagged with the current request ID.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        record = {"event": event, "request_id": request_id_var.get(), **fields}
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+def render_metrics():
+    return registry.render()
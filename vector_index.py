@@ -0,0 +1,183 @@
+# vector_index.py
+import os
+import re
+import glob
+import math
+import hashlib
+import tempfile
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+""" Compact in-process retriever for small corpora such as the lunch menu: the chunk embeddings are
+kept as one L2-normalized float32 matrix and a query is scored with a single matrix-vector product,
+optionally blended with a BM25 keyword score. The matrix can be persisted as .npy and memory-mapped,
+so an unchanged corpus is neither embedded nor copied into the process heap again. """
+
+K = 4  # chunks per query, as with Chroma's default retriever
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+class BM25:
+    """
+    Okapi BM25 over tokenized chunks. Postings are kept per term as (chunk indices, term
+    frequencies) arrays, so a query costs one vectorized update per query term.
+    """
+
+    def __init__(self, texts: List[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.size = len(texts)
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for i, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            lengths[i] = sum(terms.values())
+            for term, frequency in terms.items():
+                indices, frequencies = postings.setdefault(term, ([], []))
+                indices.append(i)
+                frequencies.append(frequency)
+
+        average_length = float(lengths.mean()) if self.size else 0.0
+        # Per-chunk length normalization of the BM25 denominator
+        self.length_norm = k1 * (1 - b + b * lengths / max(average_length, 1e-12))
+        self.k1 = k1
+        self.postings = {
+            term: (np.array(indices), np.array(frequencies, dtype=np.float32),
+                   math.log(1 + (self.size - len(indices) + 0.5) / (len(indices) + 0.5)))
+            for term, (indices, frequencies) in postings.items()
+        }
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            indices, frequencies, idf = posting
+            scores[indices] += idf * frequencies * (self.k1 + 1) / (frequencies + self.length_norm[indices])
+        return scores
+
+class VectorIndex:
+    """
+    Exact cosine-similarity retriever over an in-memory (or memory-mapped) embedding matrix.
+    It has the invoke() method of a LangChain retriever, so OllamaRAG can use it in place of Chroma.
+    """
+
+    def __init__(self, embedding: Embeddings, path: Optional[str] = None, k: int = K, bm25_weight: float = 0.0):
+        """
+        Initializes an empty index.
+
+        Parameters:
+            embedding (Embeddings): The model for embedding chunks and queries.
+            path (str): Base path of the persisted index (<path>-<hash of the chunk ids>.npy), or
+                None to keep it in memory only.
+            k (int): Number of chunks returned per query.
+            bm25_weight (float): Weight of the BM25 score in the ranking, between 0 (cosine
+                similarity only) and 1 (keywords only).
+        """
+        self.embedding = embedding
+        self.path = path
+        self.k = k
+        self.bm25_weight = bm25_weight
+        # (ids, matrix, documents, bm25) of the current corpus, replaced as a whole by build()
+        self.state = ([], np.zeros((0, 0), dtype=np.float32), [], None)
+
+    def __len__(self):
+        return len(self.state[0])
+
+    def _file(self, ids: List[str]) -> str:
+        # The file name identifies the chunks, so a matrix can never be paired with other ids
+        digest = hashlib.sha256("\n".join(ids).encode("utf-8")).hexdigest()[:32]
+        return f"{self.path}-{digest}.npy"
+
+    def _load(self, ids: List[str]) -> Optional[np.ndarray]:
+        """
+        Returns the persisted matrix of exactly these chunks memory-mapped, if there is one.
+        """
+        try:
+            matrix = np.load(self._file(ids), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        return matrix if matrix.ndim == 2 and matrix.shape[0] == len(ids) else None
+
+    def _save(self, ids: List[str], matrix: np.ndarray) -> np.ndarray:
+        """
+        Persists the matrix and returns it memory-mapped. Concurrent builders write to their own
+        temporary files and replace the final file atomically.
+        """
+        path = self._file(ids)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, matrix)
+            # Mapped before the rename: the mapping stays valid even if the file is deleted later
+            mapped = np.load(temp_path, mmap_mode="r")
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        # Matrices of earlier versions of the corpus; open mappings of them stay valid
+        for old_path in glob.glob(f"{glob.escape(self.path)}-*.npy"):
+            if old_path != path:
+                try:
+                    os.unlink(old_path)
+                except OSError:
+                    pass
+        return mapped
+
+    def build(self, chunks: Dict[str, Document]) -> int:
+        """
+        Indexes the chunks (content address -> document), reusing the persisted matrix when the
+        chunks have not changed.
+
+        Returns:
+            int: The number of chunks embedded.
+        """
+        ids = list(chunks)
+        documents = [chunks[chunk_id] for chunk_id in ids]
+        matrix = self._load(ids) if self.path else None
+        embedded = 0
+        if matrix is None:
+            matrix = normalize(self.embedding.embed_documents([doc.page_content for doc in documents])) if ids \
+                else np.zeros((0, 0), dtype=np.float32)
+            embedded = len(ids)
+            if self.path:
+                matrix = self._save(ids, matrix)
+        bm25 = BM25([doc.page_content for doc in documents]) if self.bm25_weight else None
+        self.state = (ids, matrix, documents, bm25)
+        return embedded
+
+    def search(self, query: str, k: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """
+        Returns the k best chunks for the query with their scores, best first.
+        """
+        ids, matrix, documents, bm25 = self.state
+        k = min(k or self.k, len(ids))
+        if not k:
+            return []
+
+        scores = matrix @ normalize(self.embedding.embed_query(query))
+        if bm25 is not None:
+            keyword_scores = bm25.scores(query)
+            top = keyword_scores.max()
+            if top > 0:
+                scores = (1 - self.bm25_weight) * scores + self.bm25_weight * keyword_scores / top
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+        best = best[np.argsort(-scores[best])]
+        return [(documents[i], float(scores[i])) for i in best]
+
+    def invoke(self, query: str) -> List[Document]:
+        return [doc for doc, _ in self.search(query)]
@@ -0,0 +1,236 @@
+# work_queue.py
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional, Dict, Any, Callable, List
+
+from storage import Storage
+
+class WorkQueue:
+    """
+    Durable SQLite-backed queue for incoming messages. Jobs are deduplicated on the
+    Twilio MessageSid so that webhook retries do not trigger duplicate work.
+    """
+
+    table = "work_queue"
+
+    def __init__(self, storage: Optional[Storage] = None, max_attempts: int = 3, lease: float = 300,
+                 retry_delay: float = 5, max_retry_delay: float = 300):
+        """
+        Initializes the queue.
+
+        Parameters:
+            storage (Storage): Storage holding the queue table.
+            max_attempts (int): How many times a job is tried before it is marked failed.
+            lease (float): Seconds a claimed job belongs to its worker. A job still processing
+                after that, e.g. because its worker process crashed or was recycled, is claimed
+                again by another worker. Must exceed the time it takes to handle a job.
+            retry_delay (float): Seconds a failed job waits before it can be claimed again,
+                doubling with each attempt, so that a persistent error (Twilio down, bad
+                credentials) does not use up the attempts at once.
+            max_retry_delay (float): Upper limit of the retry delay in seconds.
+        """
+        self.storage = storage or Storage()
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.available = threading.Condition()
+        self._initialize_table()
+
+    def _initialize_table(self):
+        schema = {
+            "table": self.table,
+            "fields": {
+                "id": "INTEGER PRIMARY KEY AUTOINCREMENT",
+                "message_sid": "TEXT NOT NULL",
+                "sender": "TEXT",
+                "recipient": "TEXT",
+                "body": "TEXT NOT NULL",
+                "status": "TEXT NOT NULL DEFAULT 'queued'",
+                "attempts": "INTEGER NOT NULL DEFAULT 0",
+                "result": "TEXT",
+                "created_at": "REAL NOT NULL",
+                "updated_at": "REAL NOT NULL",
+                "available_at": "REAL NOT NULL DEFAULT 0"  # a queued job is not claimed before this
+            },
+            "constraints": ["UNIQUE(message_sid)"]
+        }
+        self.storage.create_table(schema)
+
+        # Queue tables created before retries were delayed lack the column
+        columns = [row[1] for row in self.storage.execute_query(f"PRAGMA table_info({self.table})")]
+        if "available_at" not in columns:
+            self.storage.execute_query(f"ALTER TABLE {self.table} ADD COLUMN available_at REAL NOT NULL DEFAULT 0")
+
+    def enqueue(self, message_sid: str, sender: str, recipient: str, body: str) -> bool:
+        """
+        Adds a job to the queue.
+
+        Parameters:
+            message_sid (str): Twilio MessageSid of the incoming message.
+            sender (str): Address of the user the answer is sent to.
+            recipient (str): Our address the message was sent to, used as the reply sender.
+            body (str): The message body.
+
+        Returns:
+            bool: True if the job was enqueued, False if it was a duplicate.
+        """
+        now = time.time()
+        data = {
+            "message_sid": message_sid, "sender": sender, "recipient": recipient,
+            "body": body, "status": "queued", "created_at": now, "updated_at": now
+        }
+        try:
+            result = self.storage.insert_data(self.table, data, unique_columns=["message_sid"])
+        except sqlite3.IntegrityError:
+            # A concurrent retry won the race between the duplicate check and the insert
+            return False
+        if isinstance(result, str):
+            return False
+
+        with self.available:
+            self.available.notify()
+        return True
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Claims the oldest queued job whose retry delay has passed, or a job whose lease has
+        expired, for processing.
+
+        Returns:
+            dict: The claimed job, or None if the queue is empty.
+        """
+        while True:
+            now = time.time()
+            rows = self.storage.execute_query(
+                f"SELECT id, message_sid, sender, recipient, body, status, attempts, updated_at FROM {self.table} "
+                "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'processing' AND updated_at < ?) "
+                "ORDER BY id LIMIT 1",
+                (now, now - self.lease)
+            )
+            if not rows:
+                return None
+
+            job_id, message_sid, sender, recipient, body, status, attempts, updated_at = rows[0]
+            # Only one worker succeeds in claiming the job: the update requires the state it was read in
+            condition, condition_params = "id = ? AND status = ? AND updated_at = ?", (job_id, status, updated_at)
+            if status == "processing" and attempts >= self.max_attempts:
+                # Its last attempt was lost with its worker
+                self.storage.update_data(self.table, {"status": "failed", "result": "Lease expired", "updated_at": now},
+                                         condition, condition_params)
+                continue
+            claimed = self.storage.update_data(
+                self.table, {"status": "processing", "attempts": attempts + 1, "updated_at": now}, condition, condition_params
+            )
+            if claimed:
+                return {
+                    "id": job_id, "message_sid": message_sid, "sender": sender,
+                    "recipient": recipient, "body": body, "attempts": attempts + 1, "claimed_at": now
+                }
+
+    def _finish(self, job: Dict[str, Any], data: Dict[str, Any]):
+        # Does nothing if the lease has expired and the job was claimed by another worker
+        self.storage.update_data(
+            self.table, {**data, "updated_at": time.time()},
+            "id = ? AND status = 'processing' AND updated_at = ?", (job["id"], job["claimed_at"])
+        )
+
+    def complete(self, job: Dict[str, Any], result: str):
+        self._finish(job, {"status": "done", "result": result})
+
+    def fail(self, job: Dict[str, Any], error: str):
+        """
+        Returns a failed job to the queue after its retry delay, or marks it failed after max_attempts.
+        """
+        if job["attempts"] >= self.max_attempts:
+            self._finish(job, {"status": "failed", "result": error})
+            return
+        delay = min(self.retry_delay * 2 ** (job["attempts"] - 1), self.max_retry_delay)
+        self._finish(job, {"status": "queued", "result": error, "available_at": time.time() + delay})
+
+    def purge(self, max_age: float = 24 * 3600):
+        """
+        Deletes finished jobs older than max_age seconds.
+        """
+        self.storage.execute_query(
+            f"DELETE FROM {self.table} WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - max_age,)
+        )
+
+    def wait(self, timeout: float):
+        with self.available:
+            self.available.wait(timeout)
+
+    def start_workers(self, handler: Callable[[str], str], sender, count: int = 2, poll_interval: float = 1.0) -> List[threading.Thread]:
+        """
+        Starts background worker threads that process jobs with handler and deliver
+        the answers with sender.
+
+        Parameters:
+            handler (callable): Produces the answer text for a message body.
+            sender: Object with a send(to, from_, body) method.
+            count (int): Number of worker threads.
+            poll_interval (float): Seconds to wait for new jobs when the queue is empty.
+        """
+        self.purge()
+        workers = []
+        for i in range(count):
+            worker = threading.Thread(
+                target=self._work, args=(handler, sender, poll_interval), name=f"queue-worker-{i}", daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+        return workers
+
+    def _work(self, handler, sender, poll_interval):
+        while True:
+            job = self.claim()
+            if job is None:
+                self.wait(poll_interval)
+                continue
+
+            try:
+                answer = handler(job["body"])
+                sender.send(job["sender"], job["recipient"], answer)
+                self.complete(job, answer)
+            except Exception as e:
+                print(f"Job {job['message_sid']} failed: {e}")
+                self.fail(job, str(e))
+
+class TwilioSender:
+    """
+    Delivers answers through the Twilio REST API.
+    """
+
+    def __init__(self, account_sid: Optional[str] = None, auth_token: Optional[str] = None, base_url: Optional[str] = None):
+        from twilio.rest import Client
+
+        account_sid = account_sid or os.environ.get("TWILIO_ACCOUNT_SID")
+        auth_token = auth_token or os.environ.get("TWILIO_AUTH_TOKEN")
+        if account_sid is None or auth_token is None:
+            raise ValueError("Twilio credentials not found. Please set TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN.")
+        self.client = Client(account_sid, auth_token)
+
+        # TWILIO_BASE_URL points the client at another API server, e.g. a local stand-in for benchmarks
+        base_url = base_url or os.environ.get("TWILIO_BASE_URL")
+        if base_url:
+            self.client.api.base_url = base_url
+
+    def send(self, to: str, from_: str, body: str):
+        self.client.messages.create(to=to, from_=from_, body=body)
+
+class StubSender:
+    """
+    Local stand-in for TwilioSender that records the sent messages, for tests and development.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, to: str, from_: str, body: str):
+        print(f"Stub message to {to}: {body}")
+        with self.lock:
+            self.sent.append({"to": to, "from": from_, "body": body})